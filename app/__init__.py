@@ -2,12 +2,12 @@ from flask import Flask
 from flask_socketio import SocketIO
 from flask_sqlalchemy import SQLAlchemy
 from config import Config
+from app.utils.database import engine_options, configure_engine
 import os
 from flask_migrate import Migrate
 
 db = SQLAlchemy()
-socketio = SocketIO(async_mode='threading', 
-                   cors_allowed_origins="*",
+socketio = SocketIO(cors_allowed_origins="*",
                    ping_timeout=10,
                    ping_interval=5)
 migrate = Migrate()
@@ -15,6 +15,7 @@ migrate = Migrate()
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     
     db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
     db_dir = os.path.dirname(db_path)
@@ -23,14 +24,52 @@ def create_app(config_class=Config):
         os.makedirs(db_dir)
     
     db.init_app(app)
-    socketio.init_app(app)
+    # Com uma fila de mensagens (ex.: Redis) vários workers compartilham as emissões
+    socketio.init_app(app,
+                      async_mode=app.config.get('SOCKETIO_ASYNC_MODE'),
+                      message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE'))
     migrate.init_app(app, db)
+    from app.utils.log import log_pipeline
+    log_pipeline.configure(app)
     
     with app.app_context():
-        from app import routes, sockets, models
+        # Os PRAGMAs precisam estar registrados antes da primeira conexão
+        configure_engine(db.engine, app.config)
+        from app.utils.metrics import metrics
+        metrics.init_app(app, db.engine)
+        # Cria as tabelas antes de importar os módulos que as consultam
+        from app import models
         db.create_all()
+        from app.utils.db_pool import db_pool
+        from app.utils.settings_cache import settings_cache
+        from app.events.state_backend import init_state_backend
+        from app.utils.admission_tokens import admission_tokens
+        db_pool.init_app(app)
+        settings_cache.configure(app)
+        admission_tokens.configure(app)
+        state_backend = init_state_backend(app)
+        from app import routes, sockets
         models.Users.init_default_admin(app)
         
+        from app.events.slot_ledger import slot_ledger
+        from app.utils.hold_writer import hold_writer
+        from app.utils.expiry_scheduler import expiry_scheduler
+        from app.utils.slot_broadcaster import slot_broadcaster
+        from app.events.status_channel import status_channel
+        from app.events.presence import presence
+        from app.events.admission_pump import admission_pump
+        slot_ledger.use_store(state_backend.slot_store())
+        with state_backend.transaction():
+            # Sem outro worker vivo, os contadores compartilhados podem ter
+            # sobrado de antes de um reinício completo e são refeitos do banco
+            slot_ledger.rebuild(reset=presence.alone(app))
+        hold_writer.start(app)
+        expiry_scheduler.start(app)
+        slot_broadcaster.start(app)
+        status_channel.start(app)
+        presence.start(app)
+        admission_pump.start(app)
+        
     return app
 
 app = create_app()
\ No newline at end of file
@@ -0,0 +1,91 @@
+from app import socketio
+from app.events.events_manager import events_manager, grant_access
+from app.events.presence import presence
+from app.utils.settings_cache import settings_cache
+from app.utils.metrics import metrics
+from app.utils.log import logger
+
+class AdmissionPump:
+    """
+    Admissão contínua das filas de espera.
+
+    A cada tick, calcula a capacidade livre de cada sala e admite de uma vez
+    até batch_size usuários, enviando os access_granted do lote em uma única
+    emissão. O ritmo é limitado por Settings.admission_rate (usuários por
+    segundo neste worker), que suaviza a carga das reservas quando muitas
+    vagas abrem ao mesmo tempo. Saídas, timeouts de interação e aumentos de
+    max_users são atendidos no próximo tick.
+
+    Sem fila de mensagens (SOCKETIO_MESSAGE_QUEUE), o access_granted só chega
+    aos sids conectados a este worker: cada worker admite apenas os seus, e os
+    sids de outros workers (ou desconectados aguardando reconexão) mantêm o
+    lugar na fila.
+    """
+
+    def __init__(self):
+        self.tick = 0.25
+        self.batch_size = 50
+        # Admissões acumuladas ainda não usadas (fração de usuário inclusive)
+        self.budget = 0.0
+        # Sala por onde começa o próximo tick, para revezar entre as salas
+        self.offset = 0
+        # Filtro dos sids que este worker pode avisar (None: todos)
+        self.admissible = None
+        self.app = None
+
+    def start(self, app):
+        if self.app is not None:
+            return
+        self.app = app
+        self.tick = app.config.get('ADMISSION_TICK', self.tick)
+        self.batch_size = app.config.get('ADMISSION_BATCH_SIZE', self.batch_size)
+        if not app.config.get('SOCKETIO_MESSAGE_QUEUE'):
+            self.admissible = presence.local.__contains__
+        self.admitted = metrics.counter(
+            'eventreserve_admissions_total', 'Usuários admitidos da fila pela bomba de admissão')
+        socketio.start_background_task(self._run)
+
+    def _limit(self, rate):
+        """Admissões permitidas neste tick"""
+        if rate <= 0:
+            return self.batch_size
+        # O saldo não acumula além de um lote, para não liberar uma rajada depois de um período ocioso
+        self.budget = min(self.budget + rate * self.tick, max(rate * self.tick, self.batch_size))
+        return min(self.batch_size, int(self.budget))
+
+    def pump(self):
+        """Admite um lote em cada sala com capacidade livre. Retorna [(sala, usuários)]"""
+        events_manager._update_settings()
+        rate = settings_cache.get().admission_rate
+        limit = self._limit(rate)
+        rooms = events_manager.all_rooms()
+        if not rooms or limit <= 0:
+            return []
+
+        self.offset = (self.offset + 1) % len(rooms)
+        batches = []
+        for room in rooms[self.offset:] + rooms[:self.offset]:
+            if limit <= 0:
+                break
+            admitted = room.admit_batch(limit, self.admissible)
+            if admitted:
+                limit -= len(admitted)
+                if rate > 0:
+                    self.budget -= len(admitted)
+                batches.append((room, admitted))
+        return batches
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.tick)
+            try:
+                with self.app.app_context():
+                    batches = self.pump()
+                for room, admitted in batches:
+                    grant_access(admitted, room)
+                    self.admitted.inc(amount=len(admitted))
+                    logger.debug('Lote admitido da fila', extra={'event_id': room.event_id, 'count': len(admitted)})
+            except Exception:
+                logger.exception('Erro ao admitir usuários da fila')
+
+admission_pump = AdmissionPump()
@@ -1,140 +1,397 @@
+import sys
+import time
 from threading import Lock
-from collections import deque
-from datetime import UTC, datetime, timedelta
 from app import db, socketio
-from app.models import Settings
+from app.utils.settings_cache import settings_cache
+from app.events.state_backend import get_state_backend
+from app.events.slot_ledger import slot_ledger
+from app.utils.admission_tokens import admission_tokens
+from app.utils.log import logger
+
+# Sala de quem ainda não escolheu um evento (página inicial)
+GENERAL_ROOM = 'geral'
+
+# Campos aceitos das informações do navegador, na ordem do registro, e tamanho máximo de cada um
+BROWSER_FIELDS = ('browser', 'icon', 'platform')
+BROWSER_FIELD_SIZE = 32
+# Combinações distintas de navegador compartilhadas entre as conexões
+BROWSER_PROFILES_MAX = 1024
+# Ícones enviados pelo getBrowserInfo() de index.html; os demais viram o genérico
+BROWSER_ICONS = frozenset(('fab fa-edge', 'fab fa-chrome', 'fab fa-firefox', 'fab fa-safari', 'fab fa-opera', 'fas fa-globe'))
+DEFAULT_BROWSER_ICON = 'fas fa-globe'
+
+class Connection:
+    """
+    Registro compacto de uma conexão (sid): a sala, o perfil do navegador
+    (uma tupla compartilhada entre conexões iguais) e, enquanto desconectada,
+    o prazo para reconectar em time.time(). O relógio de parede continua
+    valendo depois de um reinício da máquina, quando o arquivo do backend
+    SQLite é reaproveitado.
+    """
+    __slots__ = ('room', 'browser', 'detached_until')
+
+    def __init__(self, room=None, browser=None, detached_until=None):
+        self.room = room
+        self.browser = browser
+        self.detached_until = detached_until
+
+    # Serialização usada pelo backend SQLite
+    def pack(self):
+        return [self.room, self.browser, self.detached_until]
+
+    @classmethod
+    def unpack(cls, state):
+        room, browser, detached_until = state
+        return cls(room, tuple(browser) if browser else None, detached_until)
+
+class WaitingRoom:
+    """
+    Sala de espera de um evento.
+
+    Cada sala tem os próprios usuários com acesso, a própria fila e o próprio
+    lock, e admite até max_users usuários ao mesmo tempo. Um lançamento
+    concorrido em um evento não afeta as salas dos demais. A sala geral, de
+    quem só navega pela lista de eventos, não tem limite nem fila: a admissão
+    acontece na sala do evento escolhido.
+    """
+
+    def __init__(self, manager, key):
+        self.manager = manager
+        self.key = key
+        backend = manager.backend
+        self.active_users = backend.set(f'active_users:{key}')
+        self.waiting_queue = backend.queue(f'waiting_queue:{key}')
+        # Sala do Socket.IO que recebe o status desta fila
+        self.channel = f'sala:{key}'
+
+    @property
+    def event_id(self):
+        return None if self.key == GENERAL_ROOM else self.key
+
+    def transaction(self):
+        return self.manager.backend.transaction(self.key)
+
+    def add(self, user_id):
+        """Concede acesso se houver vaga na sala; senão coloca na fila. Retorna True se admitido"""
+        with self.transaction():
+            self._clean_expired_queue_users()
+
+            if self.event_id is None:
+                self.active_users.add(user_id)
+                return True
+
+            # Com fila, a vaga livre pertence a quem já espera e é entregue pela bomba de admissão
+            if not len(self.waiting_queue) and len(self.active_users) < self.manager.max_users:
+                self.active_users.add(user_id)
+                return True
+
+            self.waiting_queue.append(user_id, time.time())
+            return False
+
+    def remove(self, user_id):
+        with self.transaction():
+            self.active_users.discard(user_id)
+            self.waiting_queue.remove(user_id)
+
+    def _clean_expired_queue_users(self):
+        queue_timeout = self.manager.queue_timeout
+        cutoff = time.time() - queue_timeout
+        # Os mais antigos estão sempre no início da fila
+        expired_users = self.waiting_queue.pop_expired(cutoff)
+
+        if expired_users:
+            logger.info('Usuários removidos da fila por timeout (%ss)', queue_timeout, extra={
+                'event_id': self.event_id,
+                'count': len(expired_users),
+                'sample': 'queue_timeout'
+            })
+        for user_id in expired_users:
+            self.manager.forget_room(user_id)
+            socketio.emit('queue_timeout', {
+                'message': 'Seu tempo na fila expirou'
+            }, room=user_id)
+
+        return expired_users
+
+    def free_capacity(self):
+        return max(0, self.manager.max_users - len(self.active_users))
+
+    def admit_batch(self, limit=None, admissible=None):
+        """
+        Admite de uma vez, em uma única transação, até limit usuários do início
+        da fila, sem passar do limite de acessos da sala. Com admissible, só
+        os usuários aceitos por ele são admitidos; os demais mantêm o lugar.
+        Retorna os admitidos.
+        """
+        with self.transaction():
+            self._clean_expired_queue_users()
+            count = min(self.free_capacity(), len(self.waiting_queue))
+            if limit is not None:
+                count = min(count, limit)
+            admitted = []
+            if admissible is None:
+                for _ in range(count):
+                    admitted.append(self.waiting_queue.popleft())
+            elif count:
+                for user_id in self.waiting_queue:
+                    if admissible(user_id):
+                        admitted.append(user_id)
+                        if len(admitted) == count:
+                            break
+                for user_id in admitted:
+                    self.waiting_queue.remove(user_id)
+            for user_id in admitted:
+                self.active_users.add(user_id)
+            return admitted
+
+    def position(self, user_id):
+        return self.waiting_queue.position(user_id)
+
+    def time_remaining(self, user_id):
+        queue_time = self.waiting_queue.enqueued_at(user_id)
+        if queue_time is None:
+            return None
+
+        elapsed = time.time() - queue_time
+        remaining = max(0, self.manager.queue_timeout - elapsed)
+        return int(remaining)
+
+    def move_to_end_of_queue(self, user_id):
+        """Devolve um usuário com acesso ao fim da fila; a vaga é preenchida pela bomba de admissão"""
+        with self.transaction():
+            if self.event_id is None or user_id not in self.active_users:
+                return False
+            self.active_users.remove(user_id)
+            self.waiting_queue.append(user_id, time.time())
+            return True
 
 class EventsManager:
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(EventsManager, cls).__new__(cls)
             cls._instance.initialize()
         return cls._instance
-    
+
     def initialize(self):
-        self.active_users = set()
-        self.waiting_queue = deque()
-        self.user_queue_times = {}
-        self.user_browser_info = {}
-        self.lock = Lock()
+        # As estruturas vêm do backend de estado, em memória ou compartilhado entre workers
+        self.backend = get_state_backend()
+        self.rooms = {}
+        self.rooms_lock = Lock()
+        # Chaves das salas abertas (também as abertas por outros workers)
+        self.room_keys = self.backend.hash('waiting_rooms')
+        # sid -> Connection
+        self.connections = self.backend.hash('connections', record=Connection)
+        # Perfil de navegador -> a mesma tupla, compartilhada pelas conexões deste worker
+        self.browser_profiles = {}
+        self.settings_version = None
         self._update_settings()
-        
+
     def _update_settings(self):
-        settings = Settings.get_settings()
+        settings = settings_cache.get()
+        if settings.version == self.settings_version:
+            return
+        self.settings_version = settings.version
         self.max_users = settings.max_users
         self.queue_timeout = settings.queue_timeout
         self.choice_timeout = settings.choice_timeout
         self.max_events = settings.max_events
-        print(f"Configurações atualizadas: max_users={self.max_users}, queue_timeout={self.queue_timeout}")
-        
-    def add_user(self, user_id):
-        with self.lock:
-            self._update_settings()
-            self._clean_expired_queue_users()
-            
-            if len(self.active_users) < self.max_users:
-                self.active_users.add(user_id)
-                return True
-                
-            self.waiting_queue.append(user_id)
-            self.user_queue_times[user_id] = datetime.now(UTC)
-            return False
-            
+        logger.info('Configurações atualizadas: max_users=%s, queue_timeout=%s', self.max_users, self.queue_timeout)
+
+    @staticmethod
+    def room_key(event_id):
+        """Chave da sala do evento; ids inválidos ou desconhecidos vão para a sala geral"""
+        try:
+            event_id = int(event_id)
+        except (TypeError, ValueError):
+            return GENERAL_ROOM
+        return event_id if slot_ledger.snapshot(event_id) else GENERAL_ROOM
+
+    def room(self, key):
+        room = self.rooms.get(key)
+        if room is None:
+            with self.rooms_lock:
+                room = self.rooms.get(key)
+                if room is None:
+                    room = self.rooms[key] = WaitingRoom(self, key)
+                    self.room_keys[str(key)] = key
+        return room
+
+    def all_rooms(self):
+        return [self.room(key) for _, key in self.room_keys.items()]
+
+    def room_of(self, user_id):
+        connection = self.connections.get(user_id)
+        if connection is None or connection.room is None:
+            return None
+        return self.room(connection.room)
+
+    def forget_room(self, user_id):
+        with self.backend.transaction():
+            connection = self.connections.get(user_id)
+            if connection is not None:
+                connection.room = None
+                self.connections[user_id] = connection
+
+    def add_user(self, user_id, key=GENERAL_ROOM):
+        """
+        Coloca o usuário na sala indicada, saindo da sala anterior.
+        Retorna (admitido, sala_anterior); a sala anterior pode ter vaga livre.
+        """
+        self._update_settings()
+        previous = self.room_of(user_id)
+        if previous is not None and previous.key == key:
+            with previous.transaction():
+                if user_id in previous.active_users:
+                    return True, None
+                if user_id in previous.waiting_queue:
+                    return False, None
+        if previous is not None:
+            previous.remove(user_id)
+        with self.backend.transaction():
+            connection = self.connections.get(user_id) or Connection()
+            connection.room = key
+            self.connections[user_id] = connection
+        return self.room(key).add(user_id), previous
+
+    def _browser_profile(self, browser_info):
+        """Reduz as informações do cliente aos campos conhecidos, com tamanho limitado"""
+        if not isinstance(browser_info, dict):
+            return None
+        fields = {field: str(browser_info.get(field) or '')[:BROWSER_FIELD_SIZE] for field in BROWSER_FIELDS}
+        if fields['icon'] not in BROWSER_ICONS:
+            fields['icon'] = DEFAULT_BROWSER_ICON
+        profile = tuple(fields[field] for field in BROWSER_FIELDS)
+        shared = self.browser_profiles.get(profile)
+        if shared is None:
+            shared = tuple(sys.intern(value) for value in profile)
+            if len(self.browser_profiles) < BROWSER_PROFILES_MAX:
+                self.browser_profiles[shared] = shared
+        return shared
+
     def set_user_browser_info(self, user_id, browser_info):
         """Armazena as informações do navegador do usuário"""
-        with self.lock:
-            self.user_browser_info[user_id] = browser_info
-            
+        browser = self._browser_profile(browser_info)
+        with self.backend.transaction():
+            connection = self.connections.get(user_id)
+            if connection is not None:
+                connection.browser = browser
+                self.connections[user_id] = connection
+
+    def browser_info(self):
+        """Informações do navegador por sid, no formato enviado pelo cliente"""
+        return {
+            user_id: dict(zip(BROWSER_FIELDS, connection.browser))
+            for user_id, connection in list(self.connections.items())
+            if connection.browser
+        }
+
     def remove_user(self, user_id):
-        with self.lock:
-            if user_id in self.active_users:
-                self.active_users.remove(user_id)
-            if user_id in self.waiting_queue:
-                self.waiting_queue.remove(user_id)
-            self.user_queue_times.pop(user_id, None)
-            self.user_browser_info.pop(user_id, None)
-            
-    def _clean_expired_queue_users(self):
-        current_time = datetime.now(UTC)
-        expired_users = []
-        
-        for user_id in list(self.waiting_queue):
-            queue_time = self.user_queue_times.get(user_id)
-            if queue_time:
-                elapsed_time = (current_time - queue_time).total_seconds()
-                if elapsed_time > self.queue_timeout:
-                    expired_users.append(user_id)
-                    print(f"Usuário {user_id} removido da fila após {elapsed_time} segundos (timeout: {self.queue_timeout})")
-                    socketio.emit('queue_timeout', {
-                        'message': 'Seu tempo na fila expirou'
-                    }, room=user_id)
-        
-        for user_id in expired_users:
-            self.waiting_queue.remove(user_id)
-            self.user_queue_times.pop(user_id, None)
-            
-        return expired_users
-                
-    def _process_queue(self):
-        self._update_settings()
-        self._clean_expired_queue_users()
-        
-        if self.waiting_queue and len(self.active_users) < self.max_users:
-            next_user = self.waiting_queue.popleft()
-            self.user_queue_times.pop(next_user, None)
-            self.active_users.add(next_user)
-            return next_user
-        return None
-        
-    def get_queue_position(self, user_id):
-        try:
-            return list(self.waiting_queue).index(user_id) + 1
-        except ValueError:
+        """Remove o usuário da sua sala. Retorna a sala, que pode ter ficado com vaga livre"""
+        room = self.room_of(user_id)
+        if room is not None:
+            room.remove(user_id)
+        self.connections.pop(user_id, None)
+        return room
+
+    def detach(self, user_id, grace):
+        """
+        Conexão perdida: o usuário mantém o acesso ou o lugar na fila por grace
+        segundos, esperando a reconexão; sem sala (ou sem janela), sai na hora.
+        """
+        with self.backend.transaction():
+            connection = self.connections.get(user_id)
+            if grace > 0 and connection is not None and connection.room is not None:
+                connection.detached_until = time.time() + grace
+                self.connections[user_id] = connection
+                return
+        self.remove_user(user_id)
+
+    def resume(self, user_id, new_user_id):
+        """
+        Passa o lugar de um sid para o novo sid, em O(1): o sid anterior pode
+        estar desconectado dentro da janela ou ainda conectado (a reconexão
+        chegou antes do disconnect). Retorna (admitido, sala) ou None se não
+        houver o que retomar.
+        """
+        connection = self.connections.get(user_id)
+        if connection is None:
             return None
-            
-    def get_queue_time_remaining(self, user_id):
-        queue_time = self.user_queue_times.get(user_id)
-        if not queue_time:
+        room = self.room_of(user_id)
+        resumed = None
+        detached_until = connection.detached_until
+        if room is not None and (detached_until is None or detached_until >= time.time()):
+            with room.transaction():
+                if user_id in room.active_users:
+                    room.active_users.discard(user_id)
+                    room.active_users.add(new_user_id)
+                    resumed = True
+                elif room.waiting_queue.rename(user_id, new_user_id):
+                    resumed = False
+        if resumed is None:
+            # Um sid ainda conectado continua com o que tem
+            if detached_until is not None:
+                self.remove_user(user_id)
             return None
-        
-        elapsed = (datetime.now(UTC) - queue_time).total_seconds()
-        remaining = max(0, self.queue_timeout - elapsed)
-        return int(remaining)
-        
-    def move_to_end_of_queue(self, user_id):
-        with self.lock:
-            if user_id in self.active_users:
-                self.active_users.remove(user_id)
-                self.waiting_queue.append(user_id)
-                self.user_queue_times[user_id] = datetime.now(UTC)
-                
-                # Processa o próximo usuário da fila
-                next_user = self._process_queue()
-                return next_user
-
-    def cleanup_disconnected_users(self):
-        """Remove usuários desconectados das listas ativas e da fila"""
-        with self.lock:
-            # Remove usuários inativos da fila ativa
-            for user_id in list(self.active_users):
-                try:
-                    # Verifica se o usuário ainda está na lista de rooms do socketio
-                    if not socketio.server.rooms.get(user_id):
-                        print(f"Removendo usuário inativo: {user_id}")
-                        self.remove_user(user_id)
-                except Exception as e:
-                    print(f"Erro ao verificar status do usuário {user_id}: {str(e)}")
-            
-            # Remove usuários inativos da fila de espera
-            for user_id in list(self.waiting_queue):
-                try:
-                    if not socketio.server.rooms.get(user_id):
-                        print(f"Removendo usuário inativo da fila: {user_id}")
-                        self.waiting_queue.remove(user_id)
-                        self.user_queue_times.pop(user_id, None)
-                except Exception as e:
-                    print(f"Erro ao verificar status do usuário na fila {user_id}: {str(e)}")
-
-events_manager = EventsManager() 
\ No newline at end of file
+
+        # O registro (sala e navegador) passa inteiro para o novo sid
+        self.connections.pop(user_id, None)
+        connection.detached_until = None
+        self.connections[new_user_id] = connection
+        return resumed, room
+
+    def readmit(self, user_id, key):
+        """
+        Dá acesso à sala a um usuário cuja admissão foi comprovada por token,
+        sem passar pela fila nem pelo limite: a vaga já era dele. Retorna a sala.
+        """
+        with self.backend.transaction():
+            connection = self.connections.get(user_id) or Connection()
+            connection.room = key
+            self.connections[user_id] = connection
+        room = self.room(key)
+        with room.transaction():
+            room.waiting_queue.remove(user_id)
+            room.active_users.add(user_id)
+        return room
+
+    def sweep_detached(self):
+        """
+        Remove os desconectados cuja janela de reconexão terminou.
+        Retorna (removidos, sids ainda dentro da janela).
+        """
+        now = time.time()
+        expired = []
+        waiting = set()
+        for user_id, connection in list(self.connections.items()):
+            if connection.detached_until is None:
+                continue
+            if connection.detached_until < now:
+                expired.append(user_id)
+            else:
+                waiting.add(user_id)
+        for user_id in expired:
+            self.remove_user(user_id)
+        return len(expired), waiting
+
+    def is_admitted(self, user_id, key):
+        room = self.rooms.get(key)
+        return room is not None and user_id in room.active_users
+
+events_manager = EventsManager()
+
+def grant_access(user_ids, room):
+    """
+    Avisa os usuários (um sid ou uma lista) de que receberam acesso à sala e
+    inicia o tempo de interação. Cada usuário recebe o próprio token de
+    admissão; o início do tempo de interação vai em uma única emissão.
+    """
+    for user_id in [user_ids] if isinstance(user_ids, str) else user_ids:
+        socketio.emit('access_granted', {
+            'event_id': room.event_id,
+            'token': admission_tokens.issue_admission(room.event_id, user_id, events_manager.queue_timeout)
+        }, to=user_id)
+    socketio.emit('start_interaction_timer', {
+        'timeout': events_manager.queue_timeout
+    }, to=user_ids)
@@ -0,0 +1,174 @@
+import atexit
+import random
+import time
+import uuid
+from app import socketio
+from app.events.events_manager import events_manager
+from app.utils.log import logger
+
+class Presence:
+    """
+    Presença das conexões guiada pelo ciclo de vida do Socket.IO.
+
+    O connect registra o sid como conectado a este worker e o disconnect (que
+    também dispara no ping timeout) o remove, ambos em O(1). Cada worker grava
+    um heartbeat no backend de estado; em um intervalo próprio, o reaper remove
+    das listas os sids cujo worker parou de enviar heartbeats ou que este
+    worker não conhece mais (um disconnect perdido).
+
+    Um usuário desconectado mantém o lugar na sala por resume_grace segundos,
+    esperando a reconexão; o reaper o remove quando a janela termina. Cada
+    conexão recebe um atraso de reconexão sorteado em uma janela proporcional
+    ao número de conexões do worker, para que uma queda geral não traga todos
+    os clientes de volta no mesmo instante.
+    """
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        # sids conectados a este worker
+        self.local = set()
+        self.interval = 5
+        self.timeout = 15
+        self.resume_grace = 10
+        self.reconnect_delay = 1
+        self.reconnect_rate = 200
+        self.owners = None
+        self.workers = None
+        self.app = None
+
+    def _bind(self, app):
+        if self.workers is not None:
+            return
+        self.interval = app.config.get('PRESENCE_HEARTBEAT_INTERVAL', self.interval)
+        self.timeout = app.config.get('PRESENCE_TIMEOUT', self.timeout)
+        self.resume_grace = app.config.get('RESUME_GRACE', self.resume_grace)
+        self.reconnect_delay = app.config.get('RECONNECT_DELAY', self.reconnect_delay)
+        self.reconnect_rate = app.config.get('RECONNECT_RATE', self.reconnect_rate)
+        backend = events_manager.backend
+        # sid -> worker_id e worker_id -> último heartbeat
+        self.owners = backend.hash('presence_owners')
+        self.workers = backend.hash('presence_workers')
+
+    def start(self, app):
+        if self.app is not None:
+            return
+        self.app = app
+        self._bind(app)
+        self.heartbeat()
+        socketio.start_background_task(self._run)
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Apaga o heartbeat ao encerrar, para o próximo worker saber que está sozinho"""
+        try:
+            self.workers.pop(self.worker_id, None)
+        except Exception:
+            logger.exception('Erro ao remover o heartbeat do worker')
+
+    def alone(self, app):
+        """
+        True se nenhum outro worker enviou heartbeat dentro do timeout (ex.: na
+        partida depois de um reinício completo). O heartbeat deste worker é
+        gravado na mesma transação, para que workers iniciando juntos não se
+        considerem todos sozinhos.
+        """
+        self._bind(app)
+        now = time.time()
+        with events_manager.backend.transaction():
+            alive = [
+                worker_id for worker_id, seen in self.workers.items()
+                if worker_id != self.worker_id and now - seen <= self.timeout
+            ]
+            self.heartbeat()
+        return not alive
+
+    def connect(self, sid):
+        self.local.add(sid)
+        self.owners[sid] = self.worker_id
+
+    def disconnect(self, sid):
+        self.local.discard(sid)
+        self.owners.pop(sid, None)
+
+    def count(self):
+        """Conexões de usuários neste worker"""
+        return len(self.local)
+
+    def reconnect_hint(self):
+        """Atraso sorteado e atraso máximo (em segundos) para este cliente reconectar"""
+        # Janela em que todos os clientes do worker voltam a reconnect_rate por segundo
+        window = max(self.reconnect_delay, self.count() / self.reconnect_rate)
+        return {
+            'delay': round(random.uniform(self.reconnect_delay, window), 3),
+            'delay_max': round(window * 2, 3)
+        }
+
+    def heartbeat(self):
+        self.workers[self.worker_id] = time.time()
+
+    def _is_stale(self, sid, owner, alive):
+        if owner == self.worker_id:
+            return sid not in self.local
+        return owner not in alive
+
+    def _still_stale(self, sid, alive):
+        """Confirma, com o estado atual, que o sid não tem conexão nem janela de reconexão"""
+        connection = events_manager.connections.get(sid)
+        if connection is not None and connection.detached_until is not None:
+            return False
+        owner = self.owners.get(sid)
+        if owner is not None and owner not in alive:
+            # Worker que passou a enviar heartbeats depois do retrato
+            seen = self.workers.get(owner)
+            if seen is not None and time.time() - seen <= self.timeout:
+                return False
+        return self._is_stale(sid, owner, alive)
+
+    def reap(self):
+        """Remove os usuários sem conexão viva; as vagas liberadas são preenchidas pela bomba de admissão"""
+        now = time.time()
+        with events_manager.backend.transaction():
+            self.heartbeat()
+            workers = dict(self.workers.items())
+            alive = {worker_id for worker_id, seen in workers.items() if now - seen <= self.timeout}
+            owners = dict(self.owners.items())
+            # Registros de workers encerrados
+            for sid, owner in owners.items():
+                if owner not in alive and owner != self.worker_id:
+                    self.owners.pop(sid, None)
+            for worker_id in workers:
+                if worker_id not in alive:
+                    self.workers.pop(worker_id, None)
+
+        # Desconectados ainda na janela de reconexão ficam; os que passaram dela saem
+        removed, detached = events_manager.sweep_detached()
+        for room in events_manager.all_rooms():
+            with room.transaction():
+                candidates = [
+                    sid for sid in list(room.active_users) + list(room.waiting_queue)
+                    if sid not in detached and self._is_stale(sid, owners.get(sid), alive)
+                ]
+            for sid in candidates:
+                # O retrato pode estar velho: quem conectou ou desconectou
+                # (e ganhou a janela de reconexão) desde então fica
+                with room.transaction():
+                    if not self._still_stale(sid, alive):
+                        continue
+                    events_manager.remove_user(sid)
+                    self.owners.pop(sid, None)
+                removed += 1
+
+        if removed:
+            logger.info('Usuários sem conexão removidos', extra={'count': removed})
+        return removed
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.reap()
+            except Exception:
+                logger.exception('Erro ao remover usuários sem conexão')
+
+presence = Presence()
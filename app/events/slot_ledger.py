@@ -0,0 +1,245 @@
+from threading import Lock
+from sqlalchemy import func
+from app import db
+from app.models import Event, Reservation
+from app.utils.log import logger
+
+class EventSlots:
+    """Contadores de vagas de um único evento"""
+
+    def __init__(self, total_slots, held=0, confirmed=0):
+        self.total_slots = total_slots
+        self.held = held
+        self.confirmed = confirmed
+
+    @property
+    def reservation_count(self):
+        return self.held + self.confirmed
+
+    @property
+    def available(self):
+        return max(0, self.total_slots - self.reservation_count)
+
+class MemorySlotStore:
+    """
+    Contadores de vagas mantidos na memória do processo.
+
+    Cada evento é protegido por um lock de uma faixa (lock striping), de modo
+    que eventos diferentes não disputam o mesmo lock. As operações retornam
+    None quando o evento ainda não foi carregado.
+    """
+    LOCK_STRIPES = 64
+
+    def __init__(self):
+        self.events = {}
+        # Protege apenas a estrutura do dicionário de eventos
+        self.lock = Lock()
+        self.stripes = [Lock() for _ in range(self.LOCK_STRIPES)]
+
+    def _stripe(self, event_id):
+        return self.stripes[event_id % self.LOCK_STRIPES]
+
+    def seed(self, counters, reset=False):
+        """
+        Carrega os contadores se o armazenamento estiver vazio (ou, com reset,
+        substituindo os atuais). Retorna True se carregou.
+        """
+        events = {
+            event_id: EventSlots(total, held, confirmed)
+            for event_id, (total, held, confirmed) in counters.items()
+        }
+        with self.lock:
+            if self.events and not reset:
+                return False
+            self.events = events
+            return True
+
+    def load(self, event_id, total_slots, held, confirmed):
+        with self.lock:
+            self.events.setdefault(event_id, EventSlots(total_slots, held, confirmed))
+
+    def set_total(self, event_id, total_slots):
+        with self.lock:
+            slots = self.events.get(event_id)
+            if slots is None:
+                self.events[event_id] = EventSlots(total_slots)
+                return
+        with self._stripe(event_id):
+            slots.total_slots = total_slots
+
+    def remove(self, event_id):
+        with self.lock:
+            self.events.pop(event_id, None)
+
+    def try_hold(self, event_id):
+        slots = self.events.get(event_id)
+        if slots is None:
+            return None
+        with self._stripe(event_id):
+            if slots.available <= 0:
+                return False
+            slots.held += 1
+            return True
+
+    def release(self, event_id, count):
+        slots = self.events.get(event_id)
+        if slots is None:
+            return None
+        with self._stripe(event_id):
+            slots.held = max(0, slots.held - count)
+        return True
+
+    def confirm(self, event_id):
+        slots = self.events.get(event_id)
+        if slots is None:
+            return None
+        with self._stripe(event_id):
+            slots.held = max(0, slots.held - 1)
+            slots.confirmed += 1
+        return True
+
+    def get(self, event_id):
+        """Retorna (total_slots, held, confirmed) ou None"""
+        slots = self.events.get(event_id)
+        if slots is None:
+            return None
+        with self._stripe(event_id):
+            return slots.total_slots, slots.held, slots.confirmed
+
+    def event_ids(self):
+        with self.lock:
+            return list(self.events)
+
+class SlotLedger:
+    """
+    Livro-razão das vagas de cada evento.
+
+    Mantém contadores de reservas temporárias e confirmadas em sincronia com a
+    tabela Reservation, permitindo decidir uma reserva sem consultar o banco.
+    Os contadores ficam em um armazenamento plugável: na memória do processo
+    ou compartilhado entre workers (veja app/events/state_backend.py).
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(SlotLedger, cls).__new__(cls)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self.store = MemorySlotStore()
+
+    def use_store(self, store):
+        self.store = store
+
+    def rebuild(self, reset=True):
+        """
+        Reconstrói os contadores a partir do banco de dados. Sem reset, os
+        contadores só são carregados se o armazenamento estiver vazio: com o
+        armazenamento compartilhado, um worker que inicia ao lado de outros
+        não sobrescreve as reservas temporárias feitas por eles.
+        """
+        counters = {
+            event_id: [total_slots, 0, 0]
+            for event_id, total_slots in db.session.query(Event.id, Event.total_slots)
+        }
+
+        counts = db.session.query(
+            Reservation.event_id,
+            Reservation.status,
+            func.count(Reservation.id)
+        ).filter(
+            Reservation.status.in_(['temporary', 'confirmed'])
+        ).group_by(Reservation.event_id, Reservation.status)
+
+        for event_id, status, count in counts:
+            slots = counters.get(event_id)
+            if slots is None:
+                continue
+            slots[1 if status == 'temporary' else 2] = count
+
+        if not self.store.seed(counters, reset):
+            logger.info('Contadores de vagas já carregados por outro worker')
+            return
+        self._sync_available_slots(counters)
+
+    @staticmethod
+    def _sync_available_slots(counters):
+        """Corrige Event.available_slots onde o contador divergir das reservas"""
+        stored = dict(db.session.query(Event.id, Event.available_slots))
+        updates = [
+            {'id': event_id, 'available_slots': total_slots - held - confirmed}
+            for event_id, (total_slots, held, confirmed) in counters.items()
+            if stored.get(event_id) != total_slots - held - confirmed
+        ]
+        if updates:
+            db.session.bulk_update_mappings(Event, updates)
+            db.session.commit()
+
+    def _load_event(self, event_id):
+        """Carrega um evento ausente do livro-razão (ex.: criado por outro processo)"""
+        row = db.session.query(
+            Event.total_slots,
+            Event.available_slots
+        ).filter(Event.id == event_id).first()
+        if not row:
+            return False
+
+        # available_slots é mantido a cada reserva, então não é preciso agregar;
+        # só a soma importa, por isso as ocupadas entram como temporárias
+        total_slots, available_slots = row
+        self.store.load(event_id, total_slots, total_slots - available_slots, 0)
+        return True
+
+    def _apply(self, operation, event_id, *args):
+        """Executa a operação no armazenamento, carregando o evento se necessário"""
+        try:
+            event_id = int(event_id)
+        except (TypeError, ValueError):
+            return event_id, None
+        result = operation(event_id, *args)
+        if result is None and self._load_event(event_id):
+            result = operation(event_id, *args)
+        return event_id, result
+
+    def set_total(self, event_id, total_slots):
+        """Registra um novo evento ou atualiza o total de vagas"""
+        self.store.set_total(event_id, total_slots)
+
+    def remove_event(self, event_id):
+        self.store.remove(event_id)
+
+    def try_hold(self, event_id):
+        """Reserva uma vaga temporária se houver disponibilidade. Retorna True em caso de sucesso"""
+        return bool(self._apply(self.store.try_hold, event_id)[1])
+
+    def release_hold(self, event_id, count=1):
+        """Libera vagas temporárias (cancelamento ou expiração)"""
+        self._apply(self.store.release, event_id, count)
+
+    def confirm_hold(self, event_id):
+        """Converte uma vaga temporária em confirmada"""
+        self._apply(self.store.confirm, event_id)
+
+    def available(self, event_id):
+        snapshot = self.snapshot(event_id)
+        return snapshot['available_slots'] if snapshot else 0
+
+    def snapshot(self, event_id):
+        """Retorna os dados de vagas no formato enviado aos clientes"""
+        event_id, counters = self._apply(self.store.get, event_id)
+        if counters is None:
+            return None
+        total_slots, held, confirmed = counters
+        return {
+            'event_id': event_id,
+            'available_slots': max(0, total_slots - held - confirmed),
+            'total_slots': total_slots,
+            'reservation_count': held + confirmed
+        }
+
+    def snapshot_all(self):
+        return [snapshot for snapshot in map(self.snapshot, self.store.event_ids()) if snapshot]
+
+slot_ledger = SlotLedger()
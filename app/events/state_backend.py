@@ -0,0 +1,467 @@
+"""
+Backends de estado compartilhado do EventsManager e do livro-razão de vagas.
+
+O backend em memória guarda tudo no próprio processo e é o padrão. O backend
+SQLite usa um arquivo em modo WAL acessível por vários workers da mesma
+máquina, fazendo o papel de um armazenamento estilo Redis (conjuntos, hashes,
+filas e contadores atômicos) sem exigir um serviço externo.
+"""
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from threading import RLock
+from app.events.slot_ledger import MemorySlotStore
+from app.events.waiting_queue import WaitingQueue
+
+class MemoryStateBackend:
+    """Estado mantido na memória do processo (um único worker)"""
+
+    def __init__(self):
+        self.lock = RLock()
+        # Locks por nome (ex.: um por sala de espera), criados sob demanda
+        self.locks = {}
+        # Estruturas por nome: como no SQLite, o mesmo nome é a mesma estrutura
+        self.structures = {}
+        self.slots = MemorySlotStore()
+
+    def _structure(self, name, factory):
+        structure = self.structures.get(name)
+        if structure is None:
+            with self.lock:
+                structure = self.structures.setdefault(name, factory())
+        return structure
+
+    def set(self, name):
+        return self._structure(name, set)
+
+    def hash(self, name, record=None):
+        return self._structure(name, dict)
+
+    def queue(self, name):
+        return self._structure(name, WaitingQueue)
+
+    def slot_store(self):
+        return self.slots
+
+    def transaction(self, name=None):
+        """Lock global ou, com name, o lock exclusivo daquele conjunto de estruturas"""
+        if name is None:
+            return self.lock
+        lock = self.locks.get(name)
+        if lock is None:
+            with self.lock:
+                lock = self.locks.setdefault(name, RLock())
+        return lock
+
+class SQLiteResult:
+    """Resultado já lido de um comando, para que o cursor não sobreviva ao lock da conexão"""
+
+    def __init__(self, cursor):
+        self.rows = cursor.fetchall()
+        self.lastrowid = cursor.lastrowid
+        self.rowcount = cursor.rowcount
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+class SQLiteStateBackend:
+    """
+    Estado compartilhado entre processos em um arquivo SQLite (modo WAL).
+
+    Cada worker usa uma única conexão, protegida por um lock: os comandos
+    avulsos e as transações (BEGIN IMMEDIATE, que serializa as escritas entre
+    todos os workers) tomam o lock pelo tempo em que usam a conexão.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS state_set (
+            name TEXT NOT NULL,
+            member TEXT NOT NULL,
+            PRIMARY KEY (name, member)
+        );
+        CREATE TABLE IF NOT EXISTS state_hash (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT,
+            PRIMARY KEY (name, key)
+        );
+        CREATE TABLE IF NOT EXISTS state_queue (
+            ticket INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            member TEXT NOT NULL,
+            enqueued_at REAL NOT NULL,
+            UNIQUE (name, member)
+        );
+        CREATE INDEX IF NOT EXISTS ix_state_queue_name_ticket ON state_queue (name, ticket);
+        CREATE TABLE IF NOT EXISTS slot_counters (
+            event_id INTEGER PRIMARY KEY,
+            total_slots INTEGER NOT NULL,
+            held INTEGER NOT NULL DEFAULT 0,
+            confirmed INTEGER NOT NULL DEFAULT 0
+        );
+    """
+
+    def __init__(self, path, busy_timeout=5000):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.lock = RLock()
+        # Profundidade das transações aninhadas de quem detém o lock
+        self.depth = 0
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # isolation_level=None: autocommit, transações só via transaction()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        self.db.executescript(self.SCHEMA)
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return SQLiteResult(self.db.execute(sql, params))
+
+    def executemany(self, sql, rows):
+        with self.lock:
+            self.db.executemany(sql, rows)
+
+    @contextmanager
+    def transaction(self, name=None):
+        # BEGIN IMMEDIATE já serializa as escritas no arquivo inteiro; name é ignorado
+        with self.lock:
+            self.depth += 1
+            try:
+                if self.depth == 1:
+                    self.db.execute('BEGIN IMMEDIATE')
+                yield
+            except Exception:
+                if self.depth == 1:
+                    self.db.execute('ROLLBACK')
+                raise
+            else:
+                if self.depth == 1:
+                    self.db.execute('COMMIT')
+            finally:
+                self.depth -= 1
+
+    def set(self, name):
+        return SQLiteSet(self, name)
+
+    def hash(self, name, record=None):
+        return SQLiteHash(self, name, record)
+
+    def queue(self, name):
+        return SQLiteQueue(self, name)
+
+    def slot_store(self):
+        return SQLiteSlotStore(self)
+
+class SQLiteSet:
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    def add(self, member):
+        self.backend.execute(
+            'INSERT OR IGNORE INTO state_set (name, member) VALUES (?, ?)',
+            (self.name, member)
+        )
+
+    def discard(self, member):
+        self.backend.execute(
+            'DELETE FROM state_set WHERE name = ? AND member = ?',
+            (self.name, member)
+        )
+
+    def remove(self, member):
+        self.discard(member)
+
+    def __contains__(self, member):
+        return self.backend.execute(
+            'SELECT 1 FROM state_set WHERE name = ? AND member = ?',
+            (self.name, member)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self.backend.execute(
+            'SELECT COUNT(*) FROM state_set WHERE name = ?',
+            (self.name,)
+        ).fetchone()[0]
+
+    def __iter__(self):
+        rows = self.backend.execute(
+            'SELECT member FROM state_set WHERE name = ?',
+            (self.name,)
+        ).fetchall()
+        return iter([row[0] for row in rows])
+
+class SQLiteHash:
+    """
+    Hash com valores serializados em JSON. Com record, os valores são
+    registros convertidos por record.pack() e record.unpack().
+    """
+
+    def __init__(self, backend, name, record=None):
+        self.backend = backend
+        self.name = name
+        self.record = record
+
+    def _dumps(self, value):
+        return json.dumps(value.pack() if self.record else value)
+
+    def _loads(self, text):
+        value = json.loads(text)
+        return self.record.unpack(value) if self.record else value
+
+    def __setitem__(self, key, value):
+        self.backend.execute(
+            'INSERT OR REPLACE INTO state_hash (name, key, value) VALUES (?, ?, ?)',
+            (self.name, key, self._dumps(value))
+        )
+
+    def get(self, key, default=None):
+        row = self.backend.execute(
+            'SELECT value FROM state_hash WHERE name = ? AND key = ?',
+            (self.name, key)
+        ).fetchone()
+        return self._loads(row[0]) if row else default
+
+    def pop(self, key, default=None):
+        with self.backend.transaction():
+            value = self.get(key, default)
+            self.backend.execute(
+                'DELETE FROM state_hash WHERE name = ? AND key = ?',
+                (self.name, key)
+            )
+        return value
+
+    def items(self):
+        rows = self.backend.execute(
+            'SELECT key, value FROM state_hash WHERE name = ?',
+            (self.name,)
+        ).fetchall()
+        return [(key, self._loads(value)) for key, value in rows]
+
+    def __iter__(self):
+        return iter([key for key, _ in self.items()])
+
+    def __len__(self):
+        return self.backend.execute(
+            'SELECT COUNT(*) FROM state_hash WHERE name = ?',
+            (self.name,)
+        ).fetchone()[0]
+
+class SQLiteQueue:
+    """
+    Fila de espera compartilhada com a mesma interface de WaitingQueue.
+
+    O ticket é a chave autoincremento da tabela; a posição é a contagem de
+    tickets menores no índice (name, ticket).
+    """
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+        # Tickets removidos por este processo desde a última leitura
+        self.removed_tickets = []
+
+    def __len__(self):
+        return self.backend.execute(
+            'SELECT COUNT(*) FROM state_queue WHERE name = ?',
+            (self.name,)
+        ).fetchone()[0]
+
+    def __contains__(self, member):
+        return self.ticket(member) is not None
+
+    def __iter__(self):
+        rows = self.backend.execute(
+            'SELECT member FROM state_queue WHERE name = ? ORDER BY ticket',
+            (self.name,)
+        ).fetchall()
+        return iter([row[0] for row in rows])
+
+    def append(self, member, enqueued_at):
+        with self.backend.transaction():
+            self.remove(member)
+            cursor = self.backend.execute(
+                'INSERT INTO state_queue (name, member, enqueued_at) VALUES (?, ?, ?)',
+                (self.name, member, enqueued_at)
+            )
+        return cursor.lastrowid
+
+    def remove(self, member):
+        with self.backend.transaction():
+            ticket = self.ticket(member)
+            if ticket is None:
+                return False
+            self.backend.execute('DELETE FROM state_queue WHERE ticket = ?', (ticket,))
+        self.removed_tickets.append(ticket)
+        return True
+
+    def rename(self, member, new_member):
+        cursor = self.backend.execute(
+            'UPDATE state_queue SET member = ? WHERE name = ? AND member = ?',
+            (new_member, self.name, member)
+        )
+        return cursor.rowcount > 0
+
+    def drain_removed(self):
+        removed, self.removed_tickets = self.removed_tickets, []
+        return removed
+
+    def popleft(self):
+        with self.backend.transaction():
+            row = self.backend.execute(
+                'SELECT ticket, member FROM state_queue WHERE name = ? ORDER BY ticket LIMIT 1',
+                (self.name,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.backend.execute('DELETE FROM state_queue WHERE ticket = ?', (row[0],))
+        self.removed_tickets.append(row[0])
+        return row[1]
+
+    def pop_expired(self, cutoff):
+        with self.backend.transaction():
+            rows = self.backend.execute(
+                'SELECT ticket, member FROM state_queue WHERE name = ? AND enqueued_at <= ? ORDER BY ticket',
+                (self.name, cutoff)
+            ).fetchall()
+            self.backend.executemany(
+                'DELETE FROM state_queue WHERE ticket = ?',
+                [(ticket,) for ticket, _ in rows]
+            )
+        self.removed_tickets.extend(ticket for ticket, _ in rows)
+        return [member for _, member in rows]
+
+    def position(self, member):
+        row = self.backend.execute(
+            """
+            SELECT COUNT(*) FROM state_queue
+            WHERE name = ? AND ticket <= (
+                SELECT ticket FROM state_queue WHERE name = ? AND member = ?
+            )
+            """,
+            (self.name, self.name, member)
+        ).fetchone()
+        return row[0] or None
+
+    def ticket(self, member):
+        row = self.backend.execute(
+            'SELECT ticket FROM state_queue WHERE name = ? AND member = ?',
+            (self.name, member)
+        ).fetchone()
+        return row[0] if row else None
+
+    def enqueued_at(self, member):
+        row = self.backend.execute(
+            'SELECT enqueued_at FROM state_queue WHERE name = ? AND member = ?',
+            (self.name, member)
+        ).fetchone()
+        return row[0] if row else None
+
+class SQLiteSlotStore:
+    """
+    Contadores de vagas compartilhados. A reserva de vaga é um único UPDATE
+    condicional, atômico entre todos os workers.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def seed(self, counters, reset=False):
+        # Verificação e carga na mesma transação: workers iniciando juntos carregam uma única vez
+        with self.backend.transaction():
+            if reset:
+                self.backend.execute('DELETE FROM slot_counters')
+            elif self.backend.execute('SELECT 1 FROM slot_counters LIMIT 1').fetchone() is not None:
+                return False
+            self.backend.executemany(
+                'INSERT INTO slot_counters (event_id, total_slots, held, confirmed) VALUES (?, ?, ?, ?)',
+                [(event_id, *values) for event_id, values in counters.items()]
+            )
+            return True
+
+    def load(self, event_id, total_slots, held, confirmed):
+        self.backend.execute(
+            'INSERT OR IGNORE INTO slot_counters (event_id, total_slots, held, confirmed) VALUES (?, ?, ?, ?)',
+            (event_id, total_slots, held, confirmed)
+        )
+
+    def set_total(self, event_id, total_slots):
+        self.backend.execute(
+            """
+            INSERT INTO slot_counters (event_id, total_slots) VALUES (?, ?)
+            ON CONFLICT (event_id) DO UPDATE SET total_slots = excluded.total_slots
+            """,
+            (event_id, total_slots)
+        )
+
+    def remove(self, event_id):
+        self.backend.execute('DELETE FROM slot_counters WHERE event_id = ?', (event_id,))
+
+    def _exists(self, event_id):
+        return self.backend.execute(
+            'SELECT 1 FROM slot_counters WHERE event_id = ?',
+            (event_id,)
+        ).fetchone() is not None
+
+    def try_hold(self, event_id):
+        updated = self.backend.execute(
+            """
+            UPDATE slot_counters SET held = held + 1
+            WHERE event_id = ? AND total_slots - held - confirmed > 0
+            """,
+            (event_id,)
+        ).rowcount
+        if updated:
+            return True
+        return False if self._exists(event_id) else None
+
+    def release(self, event_id, count):
+        updated = self.backend.execute(
+            'UPDATE slot_counters SET held = MAX(0, held - ?) WHERE event_id = ?',
+            (count, event_id)
+        ).rowcount
+        return True if updated else None
+
+    def confirm(self, event_id):
+        updated = self.backend.execute(
+            'UPDATE slot_counters SET held = MAX(0, held - 1), confirmed = confirmed + 1 WHERE event_id = ?',
+            (event_id,)
+        ).rowcount
+        return True if updated else None
+
+    def get(self, event_id):
+        return self.backend.execute(
+            'SELECT total_slots, held, confirmed FROM slot_counters WHERE event_id = ?',
+            (event_id,)
+        ).fetchone()
+
+    def event_ids(self):
+        return [row[0] for row in self.backend.execute('SELECT event_id FROM slot_counters').fetchall()]
+
+_state_backend = None
+
+def init_state_backend(app):
+    """Cria o backend de estado conforme STATE_BACKEND na configuração"""
+    global _state_backend
+    kind = app.config.get('STATE_BACKEND', 'memory')
+    if kind == 'memory':
+        _state_backend = MemoryStateBackend()
+    elif kind == 'sqlite':
+        _state_backend = SQLiteStateBackend(app.config['STATE_BACKEND_PATH'])
+    else:
+        raise ValueError(f"STATE_BACKEND inválido: {kind}")
+    return _state_backend
+
+def get_state_backend():
+    global _state_backend
+    if _state_backend is None:
+        _state_backend = MemoryStateBackend()
+    return _state_backend
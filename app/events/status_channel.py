@@ -0,0 +1,160 @@
+from threading import Lock
+from app import socketio
+from app.events.events_manager import events_manager, GENERAL_ROOM
+from app.events.presence import presence
+from app.utils.metrics import metrics
+from app.utils.log import logger
+
+# Sala dos administradores, que recebem as listas completas de sessões
+ADMIN_ROOM = 'admins'
+
+class StatusChannel:
+    """
+    Canal versionado do estado das sessões e da fila de espera.
+
+    A cada intervalo, se algo mudou em uma sala de espera, os clientes daquela
+    sala recebem apenas contadores agregados e os tickets que saíram da fila
+    (queue_status), com um número de sequência crescente por sala. Cada
+    cliente na fila ajusta a própria posição a partir desses tickets e, se
+    perceber uma lacuna na sequência, pede um resync.
+    As listas completas (com as informações do navegador) vão somente para a
+    sala dos administradores.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.interval = 0.2
+        self.started = False
+        self.admin_dirty = False
+        # chave da sala -> últimos contadores enviados
+        self.last_counts = {}
+        self.last_online = None
+        self.state = None
+
+    def start(self, app):
+        if self.started:
+            return
+        self.started = True
+        self.interval = app.config.get('STATUS_BROADCAST_INTERVAL', self.interval)
+        # Os números de sequência ficam no backend para serem os mesmos entre workers
+        self.state = events_manager.backend.hash('status_channel')
+        metrics.gauge('eventreserve_active_users', 'Usuários com acesso liberado', lambda: self._total(0))
+        metrics.gauge('eventreserve_queue_depth', 'Usuários nas filas de espera', lambda: self._total(1))
+        metrics.gauge('eventreserve_waiting_rooms', 'Salas de espera abertas', lambda: len(events_manager.rooms))
+        metrics.gauge('eventreserve_max_users', 'Limite de usuários com acesso simultâneo por sala', lambda: events_manager.max_users)
+        metrics.gauge('eventreserve_connected_clients', 'Sockets conectados a este worker', metrics.connected_clients)
+        socketio.start_background_task(self._run)
+
+    def mark_admin_dirty(self):
+        with self.lock:
+            self.admin_dirty = True
+
+    def _total(self, index):
+        return sum(counts[index] for counts in list(self.last_counts.values()))
+
+    @staticmethod
+    def _counts(room):
+        return len(room.active_users), len(room.waiting_queue), events_manager.max_users
+
+    def _seq(self, room):
+        return self.state.get(f'seq:{room.key}', 0) if self.state is not None else 0
+
+    def _flush_room(self, room):
+        with room.transaction():
+            removed = room.waiting_queue.drain_removed()
+            counts = self._counts(room)
+            changed = bool(removed) or counts != self.last_counts.get(room.key)
+            if changed:
+                seq = self._seq(room) + 1
+                self.state[f'seq:{room.key}'] = seq
+                self.last_counts[room.key] = counts
+
+        if changed:
+            active_count, queue_length, max_users = counts
+            # Só os usuários da sala recebem o status da sua fila
+            socketio.emit('queue_status', {
+                'event_id': room.event_id,
+                'seq': seq,
+                'active_count': active_count,
+                'queue_length': queue_length,
+                'max_users': max_users,
+                'removed': removed
+            }, to=room.channel)
+            metrics.broadcast('queue_status', room.channel)
+        return changed
+
+    def flush(self):
+        changed = False
+        for room in events_manager.all_rooms():
+            changed = self._flush_room(room) or changed
+
+        with self.lock:
+            admin_dirty, self.admin_dirty = self.admin_dirty or changed, False
+
+        online = presence.count()
+        if online != self.last_online:
+            # Total de conectados agrupado por intervalo, não a cada connect/disconnect
+            self.last_online = online
+            socketio.emit('update_online_users', {'count': online})
+            metrics.broadcast('update_online_users')
+        if admin_dirty:
+            socketio.emit('update_users_status', self.admin_snapshot(), to=ADMIN_ROOM)
+
+    def queue_snapshot(self, user_id):
+        """
+        Estado da fila da sala do cliente, coerente com o último seq enviado.
+
+        Os tickets removidos ainda não publicados são somados à posição atual,
+        pois o cliente vai descontá-los ao receber o próximo queue_status.
+        """
+        room = events_manager.room_of(user_id) or events_manager.room(GENERAL_ROOM)
+        with room.transaction():
+            queue = room.waiting_queue
+            ticket = queue.ticket(user_id)
+            position = queue.position(user_id)
+            if position is not None:
+                position += sum(1 for removed in queue.removed_tickets if removed < ticket)
+            active_count, queue_length, max_users = self._counts(room)
+            return {
+                'event_id': room.event_id,
+                'seq': self._seq(room),
+                'ticket': ticket,
+                'position': position,
+                'active_count': active_count,
+                'queue_length': queue_length,
+                'max_users': max_users
+            }
+
+    @staticmethod
+    def admin_snapshot():
+        active_users = []
+        queue = []
+        positions = {}
+        rooms = {}
+        for room in events_manager.all_rooms():
+            with room.transaction():
+                for user_id in room.active_users:
+                    active_users.append(user_id)
+                    rooms[user_id] = room.event_id
+                for position, user_id in enumerate(room.waiting_queue, start=1):
+                    queue.append(user_id)
+                    positions[user_id] = position
+                    rooms[user_id] = room.event_id
+        return {
+            'active_users': active_users,
+            'queue': queue,
+            'positions': positions,
+            'rooms': rooms,
+            'max_users': events_manager.max_users,
+            'browser_info': events_manager.browser_info()
+        }
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Erro ao enviar status da fila')
+
+status_channel = StatusChannel()
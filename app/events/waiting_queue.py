@@ -0,0 +1,148 @@
+from collections import OrderedDict
+
+class WaitingQueue:
+    """
+    Fila de espera indexada por ticket.
+
+    Cada usuário recebe um ticket crescente ao entrar na fila. Uma árvore de
+    Fenwick sobre os tickets conta quantos usuários ainda estão à frente, de
+    modo que consultar a posição, entrar e sair do meio da fila custam
+    O(log n), e retirar o primeiro ou os expirados custa O(1) por usuário.
+    A ordem fica indexada pelo ticket, então trocar o usuário dono de um
+    ticket (uma reconexão com novo sid) também custa O(1).
+    """
+    # Quantidade mínima de tickets mortos no início antes de compactar a árvore
+    COMPACT_THRESHOLD = 1024
+
+    def __init__(self):
+        # ticket -> user_id, na ordem da fila
+        self.order = OrderedDict()
+        # user_id -> (ticket, enqueued_at)
+        self.entries = {}
+        self.next_ticket = 0
+        # Ticket correspondente ao índice 1 da árvore
+        self.base = 0
+        self.tree = [0]
+        # Tickets que saíram da fila desde a última leitura (deltas para os clientes)
+        self.removed_tickets = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, user_id):
+        return user_id in self.entries
+
+    def __iter__(self):
+        return iter(self.order.values())
+
+    def _add(self, ticket, delta):
+        index = ticket - self.base + 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def _prefix(self, index):
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def _push(self):
+        """Acrescenta um novo ticket ativo ao final da árvore"""
+        index = len(self.tree)
+        self.tree.append(1 + self._prefix(index - 1) - self._prefix(index - (index & -index)))
+
+    def _compact(self):
+        """Descarta os tickets já atendidos do início da árvore (custo amortizado O(1))"""
+        if not self.entries:
+            self.base = self.next_ticket
+            self.tree = [0]
+            return
+
+        first_ticket = next(iter(self.order))
+        dead = first_ticket - self.base
+        if dead < self.COMPACT_THRESHOLD or dead < len(self.entries):
+            return
+
+        self.base = first_ticket
+        size = self.next_ticket - self.base
+        tree = [0] * (size + 1)
+        for ticket in self.order:
+            tree[ticket - self.base + 1] += 1
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+        self.tree = tree
+
+    def append(self, user_id, enqueued_at):
+        """Coloca o usuário no final da fila (reposicionando-o se já estiver nela)"""
+        self.remove(user_id)
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self._push()
+        self.order[ticket] = user_id
+        self.entries[user_id] = (ticket, enqueued_at)
+        return ticket
+
+    def remove(self, user_id):
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return False
+        del self.order[entry[0]]
+        self._add(entry[0], -1)
+        self.removed_tickets.append(entry[0])
+        self._compact()
+        return True
+
+    def popleft(self):
+        if not self.entries:
+            return None
+        ticket, user_id = self.order.popitem(last=False)
+        del self.entries[user_id]
+        self._add(ticket, -1)
+        self.removed_tickets.append(ticket)
+        self._compact()
+        return user_id
+
+    def drain_removed(self):
+        """Retorna e limpa os tickets removidos desde a última chamada"""
+        removed, self.removed_tickets = self.removed_tickets, []
+        return removed
+
+    def pop_expired(self, cutoff):
+        """Remove e retorna os usuários que entraram na fila antes de cutoff"""
+        expired = []
+        # A ordem da fila coincide com a ordem de entrada, então basta olhar o início
+        while self.order:
+            user_id = next(iter(self.order.values()))
+            if self.entries[user_id][1] > cutoff:
+                break
+            self.popleft()
+            expired.append(user_id)
+        return expired
+
+    def rename(self, user_id, new_user_id):
+        """Passa o ticket (e a posição) de user_id para new_user_id"""
+        entry = self.entries.pop(user_id, None)
+        if entry is None:
+            return False
+        self.entries[new_user_id] = entry
+        self.order[entry[0]] = new_user_id
+        return True
+
+    def position(self, user_id):
+        """Posição do usuário na fila (começando em 1) ou None"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        return self._prefix(entry[0] - self.base + 1)
+
+    def ticket(self, user_id):
+        entry = self.entries.get(user_id)
+        return entry[0] if entry else None
+
+    def enqueued_at(self, user_id):
+        entry = self.entries.get(user_id)
+        return entry[1] if entry else None
@@ -8,9 +8,46 @@ class Event(db.Model):
     available_slots = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(UTC))
     date = db.Column(db.DateTime, nullable=False)
-    reservations = db.relationship('Reservation', backref='event', lazy='joined')
+    # Consulta sob demanda: carregar um evento não traz as reservas junto
+    reservations = db.relationship('Reservation', backref='event', lazy='dynamic')
+
+    @classmethod
+    def take_slots(cls, event_id, count=1):
+        """
+        Decrementa available_slots se ainda houver count vagas (UPDATE condicional).
+        Deve ser chamado na mesma transação que grava as reservas.
+        """
+        return cls.query.filter(
+            cls.id == event_id,
+            cls.available_slots >= count
+        ).update({cls.available_slots: cls.available_slots - count}, synchronize_session=False) > 0
+
+    @classmethod
+    def release_slots(cls, event_id, count=1):
+        """Devolve vagas ao contador na mesma transação que remove as reservas"""
+        cls.query.filter(cls.id == event_id).update(
+            {cls.available_slots: cls.available_slots + count},
+            synchronize_session=False
+        )
+
+    @classmethod
+    def resize(cls, event_id, total_slots):
+        """Altera o total de vagas ajustando o contador pela diferença"""
+        cls.query.filter(cls.id == event_id).update({
+            cls.available_slots: cls.available_slots + total_slots - cls.total_slots,
+            cls.total_slots: total_slots
+        }, synchronize_session=False)
 
 class Reservation(db.Model):
+    __table_args__ = (
+        # Contagem de vagas e listagens por evento
+        db.Index('ix_reservation_event_id_status', 'event_id', 'status'),
+        # Busca da reserva temporária de uma sessão
+        db.Index('ix_reservation_event_id_session_id_status', 'event_id', 'session_id', 'status'),
+        # Varredura das reservas temporárias expiradas
+        db.Index('ix_reservation_status_expires_at', 'status', 'expires_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
     user_name = db.Column(db.String(100))
@@ -26,6 +63,13 @@ class Settings(db.Model):
     choice_timeout = db.Column(db.Integer, default=30)  
     queue_timeout = db.Column(db.Integer, default=120)   
     max_events = db.Column(db.Integer, default=10)       
+    # Limites dos eventos do Socket.IO (fichas por segundo e rajada máxima)
+    socket_rate_limit = db.Column(db.Integer, default=5)
+    socket_burst_limit = db.Column(db.Integer, default=10)
+    ip_rate_limit = db.Column(db.Integer, default=50)
+    ip_burst_limit = db.Column(db.Integer, default=200)
+    # Usuários admitidos da fila por segundo em cada worker (0 = sem limite)
+    admission_rate = db.Column(db.Integer, default=20)
     
     @classmethod
     def get_settings(cls):
@@ -1,19 +1,32 @@
-from flask import render_template, redirect, url_for, flash, request, current_app, session, jsonify, Response
+from flask import render_template, redirect, url_for, flash, request, current_app, session, jsonify, Response, stream_with_context
 import socketio
 from app import db
 from app.models import Event, Reservation, Settings, Users
 from app.forms import ReservationForm, EventForm
-from app.utils.event_utils import get_available_slots
+from app.utils.event_utils import get_available_slots, broadcast_event_update
+from app.events.slot_ledger import slot_ledger
+from app.utils.reservation_allocator import cancel_hold, confirm_hold
+from app.utils.settings_cache import settings_cache
+from app.utils.page_cache import page_cache
+from app.utils.metrics import metrics
+from app.utils.log import logger
 from config import Config
 from datetime import datetime
 from flask_wtf import FlaskForm
 from wtforms import DateTimeField
-from app.utils.reservation_cleaner import clean_expired_reservations
 from sqlalchemy.orm import joinedload
 from sqlalchemy import func, and_
 from functools import wraps
+import csv
+import io
 import json
 
+# Tamanho das páginas da API de reservas e dos lotes da exportação
+RESERVATIONS_PAGE_SIZE = 100
+RESERVATIONS_MAX_PAGE_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+RESERVATION_STATUSES = ('temporary', 'confirmed')
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -22,31 +35,34 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-@current_app.route('/')
-def index():
-    # Limpa reservas expiradas antes de mostrar os eventos
-    clean_expired_reservations()
-    # Busca os eventos com a contagem de reservas
-    events = db.session.query(
-        Event,
-        func.count(Reservation.id).label('reservation_count')
-    ).outerjoin(
-        Reservation, 
-        and_(
-            Event.id == Reservation.event_id,
-            Reservation.status == 'confirmed'  # considera apenas reservas confirmadas
-        )
-    ).group_by(Event.id).all()
+def render_index():
+    events = Event.query.all()
 
     # Prepara os dados para o template
     events_data = []
-    for event, reservation_count in events:
+    for event in events:
         event_dict = event.__dict__
-        event_dict['reservation_count'] = reservation_count
+        # available_slots é mantido a cada reserva, sem agregação
+        event_dict['reservation_count'] = event.total_slots - event.available_slots
         events_data.append(event_dict)
 
     return render_template('index.html', events=events_data)
 
+@current_app.route('/')
+def index():
+    # Página em cache por versão do catálogo; as vagas atuais chegam pelo socket
+    page = page_cache.get('index', render_index)
+    response = current_app.response_class(page.body, mimetype='text/html')
+    response.set_etag(page.etag)
+    response.last_modified = page.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@current_app.route('/metrics')
+def metrics_endpoint():
+    # Formato texto de exposição do Prometheus
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @current_app.route('/admin/login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
@@ -73,10 +89,8 @@ def admin_logout():
 @current_app.route('/admin')
 @admin_required
 def admin():
-    # Limpa reservas expiradas antes de mostrar os eventos
-    clean_expired_reservations()
-    # Carrega os eventos com suas reservas usando joinedload
-    events = Event.query.options(joinedload(Event.reservations)).all()
+    # As reservas de cada evento são buscadas pelo modal, via API
+    events = Event.query.all()
     settings = Settings.get_settings()
     return render_template('admin.html', events=events, settings=settings)
 
@@ -98,33 +112,23 @@ def reserve(event_id):
         return redirect(url_for('index'))
     
     if datetime.utcnow() > reservation.expires_at:
-        db.session.delete(reservation)
-        db.session.commit()
+        cancel_hold(reservation_id=reservation.id)
         
         # Atualiza contagem de vagas após expiração
-        available_slots = get_available_slots(event_id)
-        socketio.emit('update_event_slots', {
-            'event_id': event_id,
-            'total_slots': event.total_slots,
-            'reservation_count': event.total_slots - available_slots
-        }, broadcast=True)
+        broadcast_event_update(event_id)
         
         flash('O tempo para confirmar a reserva expirou.', 'error')
         return redirect(url_for('index'))
     
     if form.validate_on_submit():
-        reservation.user_name = form.user_name.data
-        reservation.user_phone = form.user_phone.data
-        reservation.status = 'confirmed'
-        db.session.commit()
+        status, _ = confirm_hold(event_id, session_id, form.user_name.data, form.user_phone.data)
         
         # Atualiza contagem de vagas após confirmação
-        available_slots = get_available_slots(event_id)
-        socketio.emit('update_event_slots', {
-            'event_id': event_id,
-            'total_slots': event.total_slots,
-            'reservation_count': event.total_slots - available_slots
-        }, broadcast=True)
+        broadcast_event_update(event_id)
+        
+        if status != 'confirmed':
+            flash('O tempo para confirmar a reserva expirou.', 'error')
+            return redirect(url_for('index'))
         
         flash('Reserva confirmada com sucesso!', 'success')
         return redirect(url_for('index'))
@@ -149,6 +153,8 @@ def create_event():
         )
         db.session.add(event)
         db.session.commit()
+        slot_ledger.set_total(event.id, event.total_slots)
+        page_cache.bump_catalog()
         flash('Evento criado com sucesso!')
         return redirect(url_for('admin'))
     return render_template('create_event.html', form=form)
@@ -161,8 +167,14 @@ def update_settings():
     settings.choice_timeout = int(request.form.get('choice_timeout'))
     settings.queue_timeout = int(request.form.get('queue_timeout'))
     settings.max_events = int(request.form.get('max_events'))
+    settings.socket_rate_limit = request.form.get('socket_rate_limit', settings.socket_rate_limit, type=int)
+    settings.socket_burst_limit = request.form.get('socket_burst_limit', settings.socket_burst_limit, type=int)
+    settings.ip_rate_limit = request.form.get('ip_rate_limit', settings.ip_rate_limit, type=int)
+    settings.ip_burst_limit = request.form.get('ip_burst_limit', settings.ip_burst_limit, type=int)
+    settings.admission_rate = request.form.get('admission_rate', settings.admission_rate, type=int)
     
     db.session.commit()
+    settings_cache.invalidate()
     flash('Configurações atualizadas com sucesso!')
     return redirect(url_for('admin'))
 
@@ -179,8 +191,12 @@ def edit_event(event_id):
     if form.validate_on_submit():
         event.name = form.name.data
         event.date = form.date.data
-        event.total_slots = form.total_slots.data
+        # Total e contador são ajustados no banco para não perder reservas concorrentes
+        Event.resize(event.id, form.total_slots.data)
         db.session.commit()
+        slot_ledger.set_total(event.id, form.total_slots.data)
+        page_cache.bump_catalog()
+        broadcast_event_update(event.id)
         flash('Evento atualizado com sucesso!')
         return redirect(url_for('admin'))
         
@@ -191,30 +207,71 @@ def delete_event(event_id):
     event = Event.query.get_or_404(event_id)
     db.session.delete(event)
     db.session.commit()
+    slot_ledger.remove_event(event_id)
+    page_cache.bump_catalog()
     flash('Evento excluído com sucesso!')
     return redirect(url_for('admin'))
 
+def reservations_query(event_id, status):
+    """Consulta das reservas do evento (apenas colunas), em ordem de id"""
+    query = db.session.query(
+        Reservation.id,
+        Reservation.user_name,
+        Reservation.user_phone,
+        Reservation.status,
+        Reservation.created_at
+    ).filter(Reservation.event_id == event_id)
+    if status:
+        query = query.filter(Reservation.status == status)
+    return query.order_by(Reservation.id)
+
+def reservation_data(row):
+    return {
+        'id': row.id,
+        'user_name': row.user_name,
+        'user_phone': row.user_phone,
+        'status': row.status,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'confirmed': row.status == 'confirmed'
+    }
+
+def requested_status():
+    status = request.args.get('status')
+    if status and status not in RESERVATION_STATUSES:
+        return None, (jsonify({'success': False, 'error': 'Status inválido'}), 400)
+    return status, None
+
 @current_app.route('/api/events/<int:event_id>/reservations')
 @admin_required
 def get_event_reservations(event_id):
+    """
+    Lista as reservas do evento em páginas (paginação por cursor).
+
+    Parâmetros: status, limit e after (id da última reserva da página
+    anterior, devolvido em next_cursor).
+    """
+    status, error = requested_status()
+    if error:
+        return error
+    limit = max(1, min(request.args.get('limit', RESERVATIONS_PAGE_SIZE, type=int), RESERVATIONS_MAX_PAGE_SIZE))
+    after = request.args.get('after', type=int)
+
     try:
-        # Busca o evento e suas reservas
-        event = Event.query.get_or_404(event_id)
-        reservations = Reservation.query.filter_by(event_id=event_id).all()
-        
-        # Formata os dados das reservas
-        reservations_data = []
-        for reservation in reservations:
-            reservations_data.append({
-                'user_name': reservation.user_name,
-                'user_phone': reservation.user_phone,
-                'created_at': reservation.created_at.isoformat(),
-                'confirmed': reservation.status == 'confirmed'
-            })
-        
+        if not db.session.query(Event.id).filter(Event.id == event_id).first():
+            return jsonify({'success': False, 'error': 'Evento não encontrado'}), 404
+
+        query = reservations_query(event_id, status)
+        if after is not None:
+            query = query.filter(Reservation.id > after)
+        # Busca um item a mais para saber se existe uma próxima página
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
         return jsonify({
             'success': True,
-            'reservations': reservations_data
+            'reservations': [reservation_data(row) for row in rows],
+            'next_cursor': rows[-1].id if has_more else None
         })
         
     except Exception as e:
@@ -223,6 +280,61 @@ def get_event_reservations(event_id):
             'error': str(e)
         }), 500
 
+@current_app.route('/api/events/<int:event_id>/reservations/export')
+@admin_required
+def export_event_reservations(event_id):
+    """
+    Exporta as reservas do evento em CSV ou NDJSON (?format=csv|ndjson).
+
+    As linhas são lidas do banco em lotes (yield_per) e enviadas conforme são
+    geradas, então o uso de memória não depende do tamanho do evento.
+    """
+    status, error = requested_status()
+    if error:
+        return error
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'error': 'Formato inválido'}), 400
+    if not db.session.query(Event.id).filter(Event.id == event_id).first():
+        return jsonify({'success': False, 'error': 'Evento não encontrado'}), 404
+
+    rows = reservations_query(event_id, status).yield_per(EXPORT_BATCH_SIZE)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['id', 'user_name', 'user_phone', 'status', 'created_at'])
+        for index, row in enumerate(rows, 1):
+            writer.writerow([
+                row.id,
+                row.user_name,
+                row.user_phone,
+                row.status,
+                row.created_at.isoformat() if row.created_at else ''
+            ])
+            # Envia o conteúdo acumulado a cada lote
+            if index % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_ndjson():
+        for row in rows:
+            yield json.dumps(reservation_data(row), ensure_ascii=False) + '\n'
+
+    if export_format == 'csv':
+        generator, mimetype = generate_csv(), 'text/csv'
+    else:
+        generator, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    filename = f"reservas-evento-{event_id}{'-' + status if status else ''}.{export_format}"
+    return Response(
+        stream_with_context(generator),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
 @current_app.route('/api/cancel_reservation', methods=['POST'])
 def handle_page_close_reservation():
     try:
@@ -230,31 +342,13 @@ def handle_page_close_reservation():
         event_id = data.get('event_id')
         reservation_id = data.get('reservation_id')
         
-        # Busca a reserva temporária
-        reservation = Reservation.query.filter_by(
-            id=reservation_id,
-            event_id=event_id,
-            status='temporary'
-        ).first()
-        
-        if reservation:
-            # Remove a reserva
-            db.session.delete(reservation)
-            db.session.commit()
-            
+        # Remove a reserva temporária
+        if cancel_hold(reservation_id=reservation_id, event_id=event_id):
             # Atualiza contagem de vagas
-            event = Event.query.get(event_id)
-            if event:
-                socketio.emit('update_event_slots', {
-                    'event_id': event_id,
-                    'available_slots': event.total_slots - len(event.reservations),
-                    'total_slots': event.total_slots,
-                    'reservation_count': len(event.reservations)
-                }, broadcast=True)
+            broadcast_event_update(event_id)
         
         return Response(status=200)
         
-    except Exception as e:
-        print(f"Erro ao cancelar reserva na página fechada: {str(e)}")
-        db.session.rollback()
+    except Exception:
+        logger.exception('Erro ao cancelar reserva na página fechada')
         return Response(status=500)
\ No newline at end of file
@@ -1,259 +1,279 @@
-from flask import request
-from flask_socketio import emit, join_room, leave_room
+from flask import request, session
+from flask_socketio import emit, join_room, leave_room, disconnect
 from app import socketio, db
-from app.models import Event, Reservation, Settings
-from app.events.events_manager import events_manager
+from app.models import Event, Reservation
+from app.utils.settings_cache import settings_cache
+from app.events.events_manager import events_manager, grant_access
+from app.events.status_channel import status_channel, ADMIN_ROOM
+from app.events.presence import presence
 from datetime import datetime, timedelta, UTC
-from app.utils.reservation_cleaner import clean_expired_reservations
 from sqlalchemy.sql import func
 from sqlalchemy import and_, or_
-from app.utils.event_utils import get_available_slots
+from app.utils.event_utils import get_available_slots, broadcast_event_update
+from app.utils.slot_broadcaster import slot_broadcaster
+from app.utils.rate_limiter import rate_limited, sid_limiter
+from app.utils.metrics import metrics
+from app.utils.log import logger
+from app.utils.admission_tokens import admission_tokens
+from app.utils.reservation_allocator import allocate_hold, cancel_hold, confirm_hold, normalize_choice_timeout
 
-online_users = set()
+def enter_room(user_id, key):
+    """
+    Leva o usuário para a sala de espera do evento (key), saindo da anterior.
+    Retorna (admitido, sala).
+    """
+    admitted, previous = events_manager.add_user(user_id, key)
+    room = events_manager.room(key)
+    if previous is not None and previous is not room:
+        # A vaga liberada na sala anterior é preenchida pela bomba de admissão
+        leave_room(previous.channel)
+    join_room(room.channel)
+    return admitted, room
 
-def broadcast_event_update(event_id):
-    """Função auxiliar para emitir atualização de vagas para todos os usuários"""
-    event = Event.query.get(event_id)
-    if event:
-        vacancies = event.total_slots - len(event.reservations)
-        print(f"Atualizando evento {event.id}: total={event.total_slots}, reservadas={len(event.reservations)}, vagas={vacancies}")
-        socketio.emit('update_event_slots', {
-            'event_id': event.id,
-            'available_slots': vacancies,
-            'total_slots': event.total_slots,
-            'reservation_count': len(event.reservations)
-        })
+def has_access(user_id, event_id, token):
+    """
+    True se o usuário tem acesso ativo à sala do evento. Um token de admissão
+    deste sid basta, sem consultar o estado compartilhado: ele vale pelo
+    tempo de interação, o mesmo prazo em que o acesso seria devolvido à fila.
+    """
+    if event_id is not None and admission_tokens.admits(token, event_id, user_id):
+        return True
+    return events_manager.is_admitted(user_id, events_manager.room_key(event_id))
+
+def readmit_session(user_id, previous_sid, auth):
+    """
+    Devolve o acesso comprovado pelo token de admissão da conexão anterior
+    quando o estado dela não existe mais (ex.: reinício com o backend em
+    memória). Retorna (True, sala) ou None.
+    """
+    event_id = auth.get('event_id')
+    if event_id is None or not admission_tokens.admits(auth.get('admission_token'), event_id, previous_sid):
+        return None
+    return True, events_manager.readmit(user_id, int(event_id))
+
+def resume_session(user_id, auth):
+    """
+    Retoma o lugar da conexão anterior do cliente (auth.resume_sid), se o token
+    de retomada for válido e a janela de reconexão não tiver terminado (ou,
+    sem estado da conexão anterior, se o token de admissão dela valer). Se a
+    conexão anterior ainda estiver aberta neste worker, ela é encerrada: o
+    lugar passa a ser do novo sid. Retorna (admitido, sala) ou None.
+    """
+    previous_sid = auth.get('resume_sid')
+    if previous_sid == user_id or not admission_tokens.resumes(auth.get('resume_token'), previous_sid):
+        return None
+    resumed = events_manager.resume(previous_sid, user_id) or readmit_session(user_id, previous_sid, auth)
+    if resumed is not None:
+        join_room(resumed[1].channel)
+        if previous_sid in presence.local:
+            disconnect(sid=previous_sid)
+    return resumed
+
+def queue_payload(user_id, room):
+    return {
+        **status_channel.queue_snapshot(user_id),
+        'time_remaining': room.time_remaining(user_id),
+        'queue_timeout': events_manager.queue_timeout
+    }
 
 @socketio.on('connect')
+@metrics.timed_event
+@rate_limited
 def handle_connect(auth=None):
-    clean_expired_reservations()
-    events_manager.cleanup_disconnected_users()
     user_id = request.sid
-    print(f"Usuário {user_id} conectou")
     
-    if events_manager.add_user(user_id):
-        print(f"Acesso concedido para usuário {user_id}")
-        emit('access_granted')
-        emit('start_interaction_timer', {
-            'timeout': events_manager.queue_timeout
+    # O painel admin acompanha as listas completas e não ocupa vaga na fila
+    if session.get('admin_logged_in') and (auth or {}).get('role') == 'admin':
+        join_room(ADMIN_ROOM)
+        emit('update_users_status', status_channel.admin_snapshot())
+        return
+    
+    auth = auth or {}
+    # Registrado antes de entrar nas listas, para o reaper não removê-lo
+    presence.connect(user_id)
+    # Uma reconexão dentro da janela recupera o acesso ou a posição na fila
+    resumed = resume_session(user_id, auth)
+    if resumed is not None:
+        admitted, room = resumed
+    else:
+        # O cliente que já está vendo um evento entra direto na sala daquele evento
+        admitted, room = enter_room(user_id, events_manager.room_key(auth.get('event_id')))
+    if room.event_id is None:
+        # A sala geral não tem limite: a admissão acontece ao escolher um evento
+        logger.info('Usuário conectou na sala geral', extra={'sid': user_id, 'sample': 'connect'})
+    elif admitted:
+        logger.info('Usuário reconectou e retomou o acesso' if resumed else 'Usuário conectou com acesso concedido', extra={
+            'sid': user_id,
+            'event_id': room.event_id,
+            'sample': 'connect'
         })
+        grant_access(user_id, room)
     else:
-        queue_position = events_manager.get_queue_position(user_id)
-        time_remaining = events_manager.get_queue_time_remaining(user_id)
-        print(f"Usuário {user_id} na fila: posição={queue_position}, tempo_restante={time_remaining}")
-        emit('in_queue', {
-            'position': queue_position,
-            'time_remaining': time_remaining,
-            'queue_timeout': events_manager.queue_timeout
+        logger.info('Usuário reconectou e retomou a fila' if resumed else 'Usuário conectou e entrou na fila', extra={
+            'sid': user_id,
+            'event_id': room.event_id,
+            'position': room.position(user_id),
+            'sample': 'connect'
         })
+        emit('in_queue', queue_payload(user_id, room))
     
-    online_users.add(request.sid)
-    socketio.emit('update_users_status', {
-        'active_users': list(events_manager.active_users),
-        'queue': list(events_manager.waiting_queue),
-        'max_users': events_manager.max_users,
-        'browser_info': events_manager.user_browser_info
+    # Credencial para retomar este lugar e atraso sugerido caso a conexão caia
+    emit('session', {
+        'sid': user_id,
+        'resume_token': admission_tokens.issue_resume(user_id),
+        'resume_grace': presence.resume_grace,
+        'reconnect': presence.reconnect_hint()
     })
-    socketio.emit('update_online_users', {'count': len(online_users)})
-    events = Event.query.all()
-    for event in events:
-        broadcast_event_update(event.id)
+    # Os demais clientes recebem apenas os contadores no próximo queue_status
+    emit('queue_status_sync', status_channel.queue_snapshot(user_id))
+    status_channel.mark_admin_dirty()
+    # Os demais clientes recebem o total de conectados no próximo envio do status_channel
+    emit('update_online_users', {'count': presence.count()})
+    # Envia o estado das vagas apenas para o cliente que conectou
+    slot_broadcaster.send_snapshot(user_id)
 
 @socketio.on('disconnect')
+@metrics.timed_event
 def handle_disconnect():
     user_id = request.sid
-    print(f"Usuário {user_id} desconectou")
+    logger.info('Usuário desconectou', extra={'sid': user_id, 'sample': 'disconnect'})
     
-    events_manager.remove_user(user_id)
-    
-
-    next_user = events_manager._process_queue()
-    if next_user:
-        emit('access_granted', room=next_user)
-        emit('start_interaction_timer', {
-            'timeout': events_manager.queue_timeout
-        }, room=next_user)
+    # O lugar fica guardado durante a janela de reconexão; depois dela, a vaga
+    # liberada é preenchida pela bomba de admissão. A janela é aberta antes de
+    # sair da presença, para o reaper nunca ver o sid sem nenhum dos dois
+    events_manager.detach(user_id, presence.resume_grace)
+    # Dispara também no ping timeout: remove só este sid, sem varrer as listas
+    presence.disconnect(user_id)
     
-    events_manager.cleanup_disconnected_users()
-    online_users.discard(request.sid)
+    sid_limiter.forget(user_id)
     
-    # Emitir atualizações para todos os usuários conectados
-    socketio.emit('update_users_status', {
-        'active_users': list(events_manager.active_users),
-        'queue': list(events_manager.waiting_queue)
-    })
-    socketio.emit('update_online_users', {'count': len(online_users)})
+    status_channel.mark_admin_dirty()
 
 @socketio.on('reserve_event')
+@metrics.timed_event
+@rate_limited
 def handle_reserve_event(data):
     try:
         event_id = data.get('event_id')
         user_id = request.sid
-        settings = Settings.get_settings()
+        settings = settings_cache.get()
         
-        choice_timeout = settings.choice_timeout
-        if choice_timeout > 300:
-            choice_timeout = 120
+        # A reserva acontece na sala de espera do próprio evento
+        if not has_access(user_id, event_id, data.get('token')):
+            admitted, room = enter_room(user_id, events_manager.room_key(event_id))
+            emit('queue_status_sync', status_channel.queue_snapshot(user_id))
+            status_channel.mark_admin_dirty()
+            if not admitted:
+                emit('in_queue', queue_payload(user_id, room))
+                return
+            grant_access(user_id, room)
         
-        # Criar reserva temporária
-        reservation = Reservation(
-            event_id=event_id,
-            session_id=user_id,
-            status='temporary',
-            expires_at=datetime.now(UTC) + timedelta(seconds=choice_timeout)
-        )
+        choice_timeout = normalize_choice_timeout(settings.choice_timeout)
         
-        db.session.add(reservation)
-        db.session.commit()
+        # Criar reserva temporária (a vaga é garantida antes da escrita no banco)
+        reservation = allocate_hold(event_id, user_id, choice_timeout)
+        if not reservation:
+            emit('error', {'message': 'Não há mais vagas disponíveis para este evento'})
+            return
         
-        # Emitir evento para mostrar o modal com o timer
+        # Emitir evento para mostrar o modal com o timer (um pedido repetido
+        # recebe a mesma reserva, com o tempo que resta dela)
+        remaining = (reservation.expires_at - datetime.now(UTC)).total_seconds()
         emit('show_reservation_modal', {
             'event_id': event_id,
             'reservation_id': reservation.id,
-            'timeout': choice_timeout
+            'timeout': max(1, min(choice_timeout, round(remaining)))
         })
         
-        # Atualizar status para todos os usuários
-        socketio.emit('update_users_status', {
-            'active_users': list(events_manager.active_users),
-            'queue': list(events_manager.waiting_queue),
-            'reserving_user': user_id,
-            'event_id': event_id
-        })
+        status_channel.mark_admin_dirty()
         
         # Atualizar contagem de vagas para todos
         broadcast_event_update(event_id)
         
-    except Exception as e:
-        print(f"Erro ao reservar evento: {str(e)}")
+    except Exception:
+        logger.exception('Erro ao reservar evento', extra={'sid': request.sid})
         emit('error', {'message': 'Erro ao processar reserva'})
 
 # Adicionar novo handler para expiração de reservas
 @socketio.on('reservation_expired')
+@metrics.timed_event
+@rate_limited
 def handle_reservation_expired(data):
     reservation_id = data.get('reservation_id')
-    reservation = Reservation.query.get(reservation_id)
+    hold = cancel_hold(reservation_id=reservation_id)
     
-    if reservation and reservation.status == 'temporary':
-        event_id = reservation.event_id
-        db.session.delete(reservation)
-        db.session.commit()
-        
+    if hold:
         # Broadcast da atualização de vagas
-        broadcast_event_update(event_id)
+        broadcast_event_update(hold.event_id)
 
 @socketio.on('interaction_timeout')
+@metrics.timed_event
+@rate_limited
 def handle_interaction_timeout():
     user_id = request.sid
-    # Move o usuário para o final da fila e obtém o próximo usuário
-    next_user = events_manager.move_to_end_of_queue(user_id)
+    room = events_manager.room_of(user_id)
+    if room is None:
+        return
+    # Move o usuário para o final da fila da sala; quem estava esperando é
+    # admitido pela bomba de admissão. Na sala geral não há fila
+    if not room.move_to_end_of_queue(user_id):
+        return
     
     # Notifica o usuário atual que foi movido para a fila
-    queue_position = events_manager.get_queue_position(user_id)
-    time_remaining = events_manager.get_queue_time_remaining(user_id)
-    emit('moved_to_queue', {
-        'position': queue_position,
-        'time_remaining': time_remaining,
-        'queue_timeout': events_manager.queue_timeout
-    })
-    
-    # Se houver um próximo usuário, concede acesso a ele
-    if next_user:
-        emit('access_granted', room=next_user)
-        emit('start_interaction_timer', {
-            'timeout': events_manager.queue_timeout
-        }, room=next_user)
+    emit('moved_to_queue', queue_payload(user_id, room))
     
-    # Atualiza o status para todos os usuários
-    emit('update_users_status', {
-        'active_users': list(events_manager.active_users),
-        'queue': list(events_manager.waiting_queue),
-        'max_users': events_manager.max_users
-    })
+    status_channel.mark_admin_dirty()
 
 @socketio.on('confirm_reservation')
+@metrics.timed_event
+@rate_limited
 def handle_confirm_reservation(data):
     event_id = data.get('event_id')
     user_id = request.sid
     user_name = data.get('user_name')
     user_phone = data.get('user_phone')
     
-    reservation = Reservation.query.filter_by(
-        event_id=event_id,
-        session_id=user_id,
-        status='temporary'
-    ).first()
+    try:
+        status, event_name = confirm_hold(event_id, user_id, user_name, user_phone)
+    except Exception as e:
+        emit('error', {'message': 'Erro ao confirmar reserva'})
+        return
     
-    if reservation:
-        try:
-            current_time = datetime.now(UTC)
-            expires_at = reservation.expires_at.replace(tzinfo=UTC) if reservation.expires_at else None
-            
-            if expires_at and current_time > expires_at:
-                db.session.delete(reservation)
-                db.session.commit()
-                emit('error', {'message': 'O tempo para confirmar a reserva expirou'})
-                return
-            
-            reservation.status = 'confirmed'
-            reservation.user_name = user_name
-            reservation.user_phone = user_phone
-            reservation.expires_at = None
-            db.session.commit()
-            
-            event = Event.query.get(event_id)
-            event_name = event.name if event else "evento"
-            
-            # Recalcula vagas disponíveis
-            available_slots = get_available_slots(event_id)
-            
-            emit('reservation_success', {
-                'event_id': event_id,
-                'message': f'Sua reserva para {event_name} foi confirmada com sucesso!'
-            })
-            
-            emit('close_reservation_modal')
-            
-            # Broadcast da atualização de vagas
-            broadcast_event_update(event_id)
-            
-        except Exception as e:
-            db.session.rollback()
-            emit('error', {'message': 'Erro ao confirmar reserva'})
+    if status == 'expired':
+        broadcast_event_update(event_id)
+        emit('error', {'message': 'O tempo para confirmar a reserva expirou'})
+    elif status == 'confirmed':
+        emit('reservation_success', {
+            'event_id': event_id,
+            'available_slots': get_available_slots(event_id),
+            'message': f'Sua reserva para {event_name or "evento"} foi confirmada com sucesso!'
+        })
+        
+        emit('close_reservation_modal')
+        
+        # Broadcast da atualização de vagas
+        broadcast_event_update(event_id)
     else:
         emit('error', {'message': 'Reserva temporária não encontrada'})
 
 @socketio.on('cancel_reservation')
+@metrics.timed_event
+@rate_limited
 def handle_cancel_reservation(data):
     event_id = data.get('event_id')
     reservation_id = data.get('reservation_id')
     user_id = request.sid
     
     try:
-        # Busca a reserva temporária
-        reservation = Reservation.query.filter_by(
-            id=reservation_id,
-            event_id=event_id,
-            session_id=user_id,
-            status='temporary'  # Garante que só cancela reservas temporárias
-        ).first()
+        # Remove a reserva (somente reservas temporárias)
+        hold = cancel_hold(reservation_id=reservation_id, event_id=event_id, session_id=user_id)
         
-        if reservation:
-            # Calcula o tempo restante antes de cancelar a reserva
-            time_elapsed = (datetime.now(UTC) - reservation.created_at.replace(tzinfo=UTC)).total_seconds()
+        if hold:
+            # Calcula o tempo restante da interação
+            time_elapsed = (datetime.now(UTC) - hold.created_at).total_seconds()
             remaining_interaction_time = max(0, events_manager.queue_timeout - time_elapsed)
             
-            # Remove a reserva
-            db.session.delete(reservation)
-            db.session.commit()
-            
-            # Atualizar status para todos os usuários
-            socketio.emit('update_users_status', {
-                'active_users': list(events_manager.active_users),
-                'queue': list(events_manager.waiting_queue),
-                'reserving_user': None,
-                'event_id': None
-            })
+            status_channel.mark_admin_dirty()
             
             # Broadcast da atualização de vagas
             broadcast_event_update(event_id)
@@ -267,88 +287,83 @@ def handle_cancel_reservation(data):
         else:
             emit('error', {'message': 'Reserva não encontrada ou já expirada'})
             
-    except Exception as e:
-        print(f"Erro ao cancelar reserva: {str(e)}")
-        db.session.rollback()
+    except Exception:
+        logger.exception('Erro ao cancelar reserva', extra={'sid': user_id, 'event_id': event_id})
         emit('error', {'message': 'Erro ao cancelar reserva'})
 
 # Adicionar novo handler para modal fechado
 @socketio.on('modal_closed')
+@metrics.timed_event
+@rate_limited
 def handle_modal_closed(data):
     event_id = data.get('event_id')
     reservation_id = data.get('reservation_id')
     user_id = request.sid
     
     try:
-        # Busca a reserva temporária
-        reservation = Reservation.query.filter_by(
-            id=reservation_id,
-            event_id=event_id,
-            session_id=user_id,
-            status='temporary'
-        ).first()
-        
-        if reservation:
-            # Remove a reserva
-            db.session.delete(reservation)
-            db.session.commit()
-            
+        # Remove a reserva temporária
+        if cancel_hold(reservation_id=reservation_id, event_id=event_id, session_id=user_id):
             # Broadcast da atualização de vagas
             broadcast_event_update(event_id)
             
-    except Exception as e:
-        print(f"Erro ao limpar reserva após fechar modal: {str(e)}")
-        db.session.rollback()
+    except Exception:
+        logger.exception('Erro ao limpar reserva após fechar modal', extra={'sid': user_id, 'event_id': event_id})
 
 @socketio.on('create_temporary_reservation')
+@metrics.timed_event
+@rate_limited
 def handle_create_temporary_reservation(data):
     event_id = data.get('event_id')
     user_id = request.sid
     user_name = data.get('user_name')
     user_phone = data.get('user_phone')
     
-    event = Event.query.get_or_404(event_id)
-    settings = Settings.get_settings()
-    choice_timeout = settings.choice_timeout
+    settings = settings_cache.get()
     
-    if event.available_slots > 0:
-        try:
-            # Criar reserva temporária
-            reservation = Reservation(
-                event_id=event_id,
-                session_id=user_id,
-                user_name=user_name,
-                user_phone=user_phone,
-                status='temporary',
-                expires_at=datetime.now(UTC) + timedelta(minutes=choice_timeout)
-            )
-            db.session.add(reservation)
-            event.available_slots -= 1
-            db.session.commit()
-            
-            emit('temporary_reservation_created', {
-                'event_id': event_id,
-                'reservation_id': reservation.id
-            })
-            
-            # Broadcast da atualização de vagas
-            broadcast_event_update(event_id)
-            
-        except Exception as e:
-            db.session.rollback()
-            emit('error', {'message': 'Erro ao criar reserva temporária'})
-    else:
+    # Como no reserve_event, só quem tem acesso à sala do evento reserva
+    if not has_access(user_id, event_id, data.get('token')):
+        emit('error', {'message': 'Aguarde sua vez na fila para reservar'})
+        return
+    
+    try:
+        # Criar reserva temporária
+        reservation = allocate_hold(
+            event_id,
+            user_id,
+            settings.choice_timeout,
+            user_name=user_name,
+            user_phone=user_phone
+        )
+    except Exception as e:
+        emit('error', {'message': 'Erro ao criar reserva temporária'})
+        return
+    
+    if not reservation:
         emit('error', {'message': 'Não há mais vagas disponíveis para este evento'})
+        return
+    
+    emit('temporary_reservation_created', {
+        'event_id': event_id,
+        'reservation_id': reservation.id
+    })
+    
+    # Broadcast da atualização de vagas
+    broadcast_event_update(event_id)
 
 @socketio.on('browser_info')
+@metrics.timed_event
+@rate_limited
 def handle_browser_info(data):
     """Handler para receber e armazenar informações do navegador"""
     user_id = request.sid
     events_manager.set_user_browser_info(user_id, data)
     
-    # Atualiza o status para todos os usuários com as novas informações do navegador
-    emit('update_users_status', {
-        'active_users': list(events_manager.active_users),
-        'queue': list(events_manager.waiting_queue),
-        'browser_info': events_manager.user_browser_info
-    })
\ No newline at end of file
+    # As informações do navegador só aparecem no painel admin
+    status_channel.mark_admin_dirty()
+
+@socketio.on('resync_status')
+@metrics.timed_event
+@rate_limited
+def handle_resync_status():
+    """Reenvia o estado da fila para um cliente que perdeu atualizações"""
+    emit('queue_status_sync', status_channel.queue_snapshot(request.sid))
\ No newline at end of file
@@ -0,0 +1,92 @@
+import base64
+import hashlib
+import hmac
+import time
+
+# Tipos de token
+ADMISSION = 'a'
+RESUME = 'r'
+
+class AdmissionTokens:
+    """
+    Tokens assinados (HMAC-SHA256 com a SECRET_KEY) emitidos pela sala de espera.
+
+    O token de admissão prova que um sid recebeu acesso à sala de um evento e
+    vale pelo tempo de interação; o token de retomada prova que o portador era
+    o dono de um sid, para reaver a posição dele ao reconectar. Como a
+    assinatura e a validade estão no próprio token, qualquer worker verifica
+    um token sem consultar o estado compartilhado, inclusive depois de um
+    reinício: os dois juntos devolvem o acesso da conexão anterior.
+
+    Formato: base64url("tipo|escopo|expira") + "." + base64url(assinatura), em
+    que o escopo é evento@sid no token de admissão e o sid no de retomada.
+    """
+    # Bytes da assinatura mantidos no token
+    SIGNATURE_SIZE = 16
+    # Validade do token de retomada; a janela de reconexão é controlada pelo servidor
+    RESUME_TTL = 24 * 3600
+
+    def __init__(self):
+        self.key = None
+
+    def configure(self, app):
+        # Chave derivada, para não reutilizar a SECRET_KEY das sessões diretamente
+        secret = app.config['SECRET_KEY']
+        if isinstance(secret, str):
+            secret = secret.encode()
+        self.key = hashlib.sha256(b'eventreserve-admission:' + secret).digest()
+
+    def _sign(self, body):
+        return hmac.new(self.key, body, hashlib.sha256).digest()[:self.SIGNATURE_SIZE]
+
+    @staticmethod
+    def _encode(data):
+        return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+    @staticmethod
+    def _decode(text):
+        return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+    def _issue(self, kind, scope, expires_at):
+        body = f'{kind}|{scope}|{int(expires_at)}'.encode()
+        return f'{self._encode(body)}.{self._encode(self._sign(body))}'
+
+    @staticmethod
+    def _admission_scope(event_id, sid):
+        return f"{'' if event_id is None else event_id}@{sid}"
+
+    def issue_admission(self, event_id, sid, ttl):
+        """Token de admissão do sid na sala do evento, válido por ttl segundos"""
+        return self._issue(ADMISSION, self._admission_scope(event_id, sid), time.time() + ttl)
+
+    def issue_resume(self, sid):
+        """Token de retomada da conexão sid"""
+        return self._issue(RESUME, sid, time.time() + self.RESUME_TTL)
+
+    def _verify(self, token, kind, scope):
+        """
+        Verifica assinatura, tipo, escopo e validade do token.
+        """
+        if not token or not isinstance(token, str) or self.key is None:
+            return False
+        try:
+            body_text, signature_text = token.split('.', 1)
+            body = self._decode(body_text)
+            signature = self._decode(signature_text)
+        except (ValueError, TypeError):
+            return False
+        if not hmac.compare_digest(signature, self._sign(body)):
+            return False
+
+        token_kind, token_scope, expires_at = body.decode().split('|')
+        return token_kind == kind and token_scope == str(scope) and int(expires_at) >= time.time()
+
+    def admits(self, token, event_id, sid):
+        """True se o token de admissão foi emitido para o sid na sala do evento"""
+        return bool(sid) and self._verify(token, ADMISSION, self._admission_scope(event_id, sid))
+
+    def resumes(self, token, sid):
+        """True se o token de retomada pertence à conexão sid"""
+        return bool(sid) and self._verify(token, RESUME, sid)
+
+admission_tokens = AdmissionTokens()
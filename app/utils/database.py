@@ -0,0 +1,64 @@
+"""
+Configuração do engine do banco de dados.
+
+Para SQLite (arquivo) ativa WAL, synchronous=NORMAL, mmap, busy_timeout e um
+pool de conexões dimensionado para as threads de banco. Para os demais bancos
+expõe o tamanho do pool, o overflow, o pre-ping e a reciclagem de conexões.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def engine_options(config):
+    """Opções do create_engine conforme o banco configurado"""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    # Opções definidas explicitamente na configuração têm prioridade
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+
+    if url.get_backend_name() == 'sqlite':
+        if _is_memory_sqlite(url):
+            return options
+        options.setdefault('pool_size', config.get('DB_POOL_SIZE', 10))
+        options.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 20))
+        options.setdefault('pool_timeout', config.get('DB_POOL_TIMEOUT', 30))
+        # As conexões do pool são usadas por threads diferentes
+        connect_args = dict(options.get('connect_args') or {})
+        connect_args.setdefault('check_same_thread', False)
+        options['connect_args'] = connect_args
+        return options
+
+    options.setdefault('pool_size', config.get('DB_POOL_SIZE', 10))
+    options.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 20))
+    options.setdefault('pool_timeout', config.get('DB_POOL_TIMEOUT', 30))
+    options.setdefault('pool_pre_ping', config.get('DB_POOL_PRE_PING', True))
+    options.setdefault('pool_recycle', config.get('DB_POOL_RECYCLE', 1800))
+    return options
+
+def sqlite_pragmas(config, memory=False):
+    """PRAGMAs aplicados a cada nova conexão SQLite"""
+    pragmas = [
+        f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT', 5000))}",
+        f"PRAGMA cache_size={int(config.get('SQLITE_CACHE_SIZE', -20000))}",
+    ]
+    if not memory:
+        pragmas += [
+            f"PRAGMA journal_mode={config.get('SQLITE_JOURNAL_MODE', 'WAL')}",
+            f"PRAGMA synchronous={config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+            f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 268435456))}",
+        ]
+    return pragmas
+
+def configure_engine(engine, config):
+    """Registra os PRAGMAs de SQLite nas conexões do engine (deve rodar antes da primeira conexão)"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = sqlite_pragmas(config, memory=_is_memory_sqlite(engine.url))
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
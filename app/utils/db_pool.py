@@ -0,0 +1,41 @@
+from contextvars import copy_context
+from threading import BoundedSemaphore
+from app import socketio
+
+class DatabasePool:
+    """
+    Pool limitado para o trabalho de banco de dados dos handlers.
+
+    No modo eventlet as chamadas bloqueantes do SQLAlchemy rodam em threads
+    reais (eventlet.tpool), liberando o loop de green threads para as demais
+    conexões. No modo threading a chamada roda na própria thread, limitada por
+    um semáforo ao tamanho do pool. As funções executadas devem retornar
+    apenas valores simples, pois rodam em uma sessão própria.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.tpool = None
+        self.semaphore = BoundedSemaphore(10)
+
+    def init_app(self, app):
+        self.app = app
+        size = app.config.get('DB_WORKER_POOL_SIZE', 10)
+        self.semaphore = BoundedSemaphore(size)
+        if socketio.async_mode == 'eventlet':
+            from eventlet import tpool
+            tpool.set_num_threads(size)
+            self.tpool = tpool
+
+    def _call(self, fn, args, kwargs):
+        with self.app.app_context():
+            return fn(*args, **kwargs)
+
+    def run(self, fn, *args, **kwargs):
+        if self.tpool is not None:
+            # O contexto acompanha a chamada (ex.: contagem de SQL das métricas)
+            return self.tpool.execute(copy_context().run, self._call, fn, args, kwargs)
+        with self.semaphore:
+            return fn(*args, **kwargs)
+
+db_pool = DatabasePool()
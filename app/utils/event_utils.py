@@ -1,19 +1,13 @@
-from app.models import Event, Reservation
+from app.events.slot_ledger import slot_ledger
+from app.utils.slot_broadcaster import slot_broadcaster
 
 def get_available_slots(event_id):
     """
     Calcula o número de vagas disponíveis para um evento
     """
-    event = Event.query.get(event_id)
-    if not event:
-        return 0
-        
-    # Conta todas as reservas (temporárias e confirmadas)
-    total_reservations = Reservation.query.filter(
-        Reservation.event_id == event_id,
-        Reservation.status.in_(['temporary', 'confirmed'])
-    ).count()
-    
-    # Garante que nunca retorne um número negativo
-    available_slots = max(0, event.total_slots - total_reservations)
-    return available_slots 
\ No newline at end of file
+    # Lido do livro-razão em memória, sem consultar o banco
+    return slot_ledger.available(event_id)
+
+def broadcast_event_update(event_id):
+    """Marca o evento para a próxima atualização de vagas enviada em lote"""
+    slot_broadcaster.mark_dirty(event_id)
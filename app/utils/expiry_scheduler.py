@@ -0,0 +1,111 @@
+import heapq
+import time
+from datetime import UTC
+from threading import Condition
+from app import socketio
+from app.utils.event_utils import broadcast_event_update
+from app.utils.hold_writer import hold_writer
+from app.utils.metrics import metrics
+
+def _timestamp(expires_at):
+    """Converte expires_at (com ou sem fuso, sempre em UTC) para timestamp"""
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=UTC)
+    return expires_at.timestamp()
+
+class ExpiryScheduler:
+    """
+    Agendador de expiração das reservas temporárias.
+
+    Mantém um heap mínimo ordenado por expires_at e uma tarefa em segundo plano
+    que dorme até o próximo vencimento, removendo as reservas expiradas em lotes
+    (pelo hold_writer) e emitindo uma única atualização de vagas por evento.
+    """
+    BATCH_SIZE = 200
+
+    def __init__(self):
+        self.heap = []
+        # reservation_id -> event_id das reservas ainda pendentes
+        self.pending = {}
+        self.condition = Condition()
+        self.app = None
+
+    def start(self, app):
+        """Agenda as reservas temporárias carregadas pelo hold_writer e inicia a tarefa de expiração"""
+        if self.app is not None:
+            return
+        self.app = app
+
+        with self.condition:
+            for reservation_id, event_id, expires_at in hold_writer.scheduled():
+                # Reservas sem prazo expiram imediatamente
+                deadline = _timestamp(expires_at) if expires_at else 0
+                self.pending[reservation_id] = event_id
+                self.heap.append((deadline, reservation_id))
+            heapq.heapify(self.heap)
+
+        socketio.start_background_task(self._run)
+
+    def schedule(self, reservation_id, event_id, expires_at):
+        deadline = _timestamp(expires_at)
+        with self.condition:
+            self.pending[reservation_id] = event_id
+            heapq.heappush(self.heap, (deadline, reservation_id))
+            # Acorda a tarefa apenas se o novo prazo for o mais próximo
+            if self.heap[0][1] == reservation_id:
+                self.condition.notify()
+
+    def cancel(self, reservation_id):
+        """Descarta o agendamento (reserva confirmada ou cancelada)"""
+        with self.condition:
+            self.pending.pop(reservation_id, None)
+
+    def _next_batch(self):
+        """Aguarda o próximo vencimento e retorna o lote de reservas expiradas"""
+        with self.condition:
+            while True:
+                # Remove do topo os agendamentos já cancelados
+                while self.heap and self.heap[0][1] not in self.pending:
+                    heapq.heappop(self.heap)
+
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                delay = self.heap[0][0] - time.time()
+                if delay > 0:
+                    self.condition.wait(timeout=delay)
+                    continue
+                break
+
+            now = time.time()
+            batch = []
+            while self.heap and self.heap[0][0] <= now and len(batch) < self.BATCH_SIZE:
+                _, reservation_id = heapq.heappop(self.heap)
+                event_id = self.pending.pop(reservation_id, None)
+                if event_id is not None:
+                    batch.append((reservation_id, event_id))
+            return batch
+
+    def _expire(self, batch):
+        released = set()
+        with self.app.app_context():
+            for reservation_id, _ in batch:
+                record = hold_writer.pop(reservation_id=reservation_id)
+                if record is None:
+                    continue
+                metrics.expirations.inc()
+                # Reservas já gravadas liberam a vaga quando a remoção chega ao banco
+                if hold_writer.delete(record):
+                    released.add(record.event_id)
+
+            for event_id in released:
+                broadcast_event_update(event_id)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._expire(batch)
+
+expiry_scheduler = ExpiryScheduler()
@@ -0,0 +1,333 @@
+import atexit
+from collections import OrderedDict
+from datetime import datetime, UTC
+from threading import Lock
+from sqlalchemy import func, insert
+from app import db, socketio
+from app.models import Event, Reservation
+from app.events.slot_ledger import slot_ledger
+from app.events.state_backend import get_state_backend
+from app.utils.db_pool import db_pool
+from app.utils.event_utils import broadcast_event_update
+from app.utils.log import logger
+
+def as_utc(value):
+    """Marca como UTC as datas lidas sem fuso do banco"""
+    return value.replace(tzinfo=UTC) if value and value.tzinfo is None else value
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class HoldRecord:
+    """Reserva temporária mantida em memória"""
+    __slots__ = ('id', 'event_id', 'session_id', 'user_name', 'user_phone', 'created_at', 'expires_at')
+
+    def __init__(self, id, event_id, session_id, user_name, user_phone, created_at, expires_at):
+        self.id = id
+        self.event_id = event_id
+        self.session_id = session_id
+        self.user_name = user_name
+        self.user_phone = user_phone
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+class HoldWriter:
+    """
+    Reservas temporárias em memória com gravação adiada em lote (write-behind).
+
+    A memória é a fonte da verdade das reservas temporárias deste processo: criar
+    ou cancelar uma reserva apenas registra a operação, e a cada intervalo as
+    operações pendentes são gravadas em uma única transação. Uma reserva
+    cancelada antes de ser gravada nunca chega ao banco. Os ids são reservados em
+    blocos no backend de estado para não colidir entre workers.
+
+    A vaga de uma reserva ainda não gravada é devolvida ao livro-razão na hora;
+    a de uma reserva já gravada, somente quando a remoção no banco se confirma.
+    """
+    ID_BLOCK = 1000
+    SESSION_LOCK_STRIPES = 64
+
+    def __init__(self):
+        self.records = {}
+        # (event_id, session_id) -> ids das reservas da sessão no evento
+        self.by_session = {}
+        self.pending_inserts = OrderedDict()
+        # reservation_id -> event_id das remoções pendentes
+        self.pending_deletes = {}
+        self.lock = Lock()
+        # Faixas de lock por (evento, sessão): só pedidos da mesma faixa esperam uns pelos outros
+        self.session_locks = [Lock() for _ in range(self.SESSION_LOCK_STRIPES)]
+        self.id_lock = Lock()
+        # Serializa as gravações (tarefa periódica e confirmações)
+        self.flush_lock = Lock()
+        self.next_id = 0
+        self.block_end = 0
+        self.db_max_id = 0
+        self.interval = 0.01
+        self.app = None
+
+    def start(self, app):
+        """Carrega as reservas temporárias do banco e inicia a gravação periódica"""
+        if self.app is not None:
+            return
+        self.app = app
+        self.interval = app.config.get('HOLD_FLUSH_INTERVAL', self.interval)
+        self.db_max_id = db.session.query(func.max(Reservation.id)).scalar() or 0
+
+        temporary = db.session.query(
+            Reservation.id,
+            Reservation.event_id,
+            Reservation.session_id,
+            Reservation.user_name,
+            Reservation.user_phone,
+            Reservation.created_at,
+            Reservation.expires_at
+        ).filter(Reservation.status == 'temporary')
+        with self.lock:
+            for reservation_id, event_id, session_id, user_name, user_phone, created_at, expires_at in temporary:
+                self._add(HoldRecord(
+                    reservation_id,
+                    event_id,
+                    session_id,
+                    user_name,
+                    user_phone,
+                    as_utc(created_at),
+                    as_utc(expires_at)
+                ))
+
+        socketio.start_background_task(self._run)
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Grava as operações pendentes ao encerrar o processo, para não deixar vagas presas"""
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception:
+            logger.exception('Erro ao gravar reservas temporárias no encerramento')
+
+    def _allocate_id(self):
+        with self.id_lock:
+            if self.next_id >= self.block_end:
+                backend = get_state_backend()
+                with backend.transaction():
+                    ids = backend.hash('reservation_ids')
+                    start = max(ids.get('next', 0), self.db_max_id + 1)
+                    ids['next'] = start + self.ID_BLOCK
+                self.next_id, self.block_end = start, start + self.ID_BLOCK
+            reservation_id = self.next_id
+            self.next_id += 1
+            return reservation_id
+
+    def _add(self, record):
+        self.records[record.id] = record
+        self.by_session.setdefault((record.event_id, record.session_id), []).append(record.id)
+
+    def _forget(self, record):
+        self.records.pop(record.id, None)
+        key = (record.event_id, record.session_id)
+        ids = self.by_session.get(key)
+        if ids and record.id in ids:
+            ids.remove(record.id)
+            if not ids:
+                del self.by_session[key]
+
+    def scheduled(self):
+        """Retorna (id, event_id, expires_at) das reservas para o agendador de expiração"""
+        with self.lock:
+            return [(record.id, record.event_id, record.expires_at) for record in self.records.values()]
+
+    def _live(self, event_id, session_id):
+        """Reserva ainda dentro do prazo da sessão no evento, ou None"""
+        now = datetime.now(UTC)
+        for reservation_id in self.by_session.get((event_id, session_id), ()):
+            record = self.records[reservation_id]
+            if record.expires_at is None or record.expires_at > now:
+                return record
+        return None
+
+    def create_once(self, event_id, session_id, expires_at, claim, user_name=None, user_phone=None):
+        """
+        Registra uma reserva temporária, uma por sessão em cada evento.
+
+        Se a sessão já tem uma reserva dentro do prazo no evento, ela é
+        retornada sem reservar outra vaga. Senão, claim() reserva a vaga no
+        livro-razão. A verificação e a reserva acontecem sob o lock da faixa
+        da sessão, para pedidos repetidos dela não reservarem duas vagas sem
+        que sessões e eventos diferentes esperem uns pelos outros.
+        Retorna (reserva, criada) ou (None, False) se não houver vaga.
+        """
+        event_id = _as_int(event_id)
+        if event_id is None:
+            return None, False
+        key = (event_id, session_id)
+        with self.session_locks[hash(key) % self.SESSION_LOCK_STRIPES]:
+            with self.lock:
+                record = self._live(event_id, session_id)
+            if record is not None:
+                return record, False
+            if not claim():
+                return None, False
+            record = HoldRecord(
+                self._allocate_id(),
+                event_id,
+                session_id,
+                user_name,
+                user_phone,
+                datetime.now(UTC),
+                expires_at
+            )
+            with self.lock:
+                self._add(record)
+                self.pending_inserts[record.id] = record
+        return record, True
+
+    def pop(self, reservation_id=None, event_id=None, session_id=None):
+        """Retira da memória a reserva que corresponde aos filtros, ou retorna None"""
+        event_id = _as_int(event_id) if event_id is not None else None
+        with self.lock:
+            if reservation_id is not None:
+                record = self.records.get(_as_int(reservation_id))
+                if record is None or (event_id is not None and record.event_id != event_id) \
+                        or (session_id is not None and record.session_id != session_id):
+                    return None
+            elif event_id is not None and session_id is not None:
+                ids = self.by_session.get((event_id, session_id))
+                if not ids:
+                    return None
+                record = self.records[ids[0]]
+            else:
+                return None
+            self._forget(record)
+            return record
+
+    def restore(self, record):
+        """Devolve à memória uma reserva retirada por pop (ex.: falha na confirmação)"""
+        with self.lock:
+            self._add(record)
+
+    def delete(self, record):
+        """
+        Agenda a remoção de uma reserva retirada por pop.
+        Retorna True se a vaga foi devolvida ao livro-razão imediatamente.
+        """
+        with self.lock:
+            immediate = self.pending_inserts.pop(record.id, None) is not None
+            if not immediate:
+                self.pending_deletes[record.id] = record.event_id
+        if immediate:
+            slot_ledger.release_hold(record.event_id)
+        return immediate
+
+    @staticmethod
+    def _write(inserts, deletes):
+        """Grava um lote de inserções e remoções em uma única transação"""
+        rejected = []
+        released = {}
+        try:
+            by_event = {}
+            for record in inserts:
+                by_event.setdefault(record.event_id, []).append(record)
+
+            # O contador do evento é decrementado na mesma transação das inserções
+            accepted = []
+            for event_id, records in by_event.items():
+                if Event.take_slots(event_id, len(records)):
+                    accepted.extend(records)
+                    continue
+                for record in records:
+                    (accepted if Event.take_slots(event_id) else rejected).append(record)
+
+            if accepted:
+                db.session.execute(insert(Reservation), [{
+                    'id': record.id,
+                    'event_id': record.event_id,
+                    'session_id': record.session_id,
+                    'user_name': record.user_name,
+                    'user_phone': record.user_phone,
+                    'status': 'temporary',
+                    'created_at': record.created_at,
+                    'expires_at': record.expires_at
+                } for record in accepted])
+
+            if deletes:
+                # Só contam as reservas que ainda estavam temporárias no banco
+                rows = db.session.query(Reservation.id, Reservation.event_id).filter(
+                    Reservation.id.in_(list(deletes)),
+                    Reservation.status == 'temporary'
+                ).all()
+                if rows:
+                    Reservation.query.filter(
+                        Reservation.id.in_([reservation_id for reservation_id, _ in rows]),
+                        Reservation.status == 'temporary'
+                    ).delete(synchronize_session=False)
+                for _, event_id in rows:
+                    released[event_id] = released.get(event_id, 0) + 1
+                for event_id, count in released.items():
+                    Event.release_slots(event_id, count)
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return rejected, released
+
+    def flush(self):
+        """Grava as operações pendentes. Em caso de erro elas voltam para a fila"""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending_inserts and not self.pending_deletes:
+                    return
+                inserts = list(self.pending_inserts.values())
+                deletes = self.pending_deletes
+                self.pending_inserts = OrderedDict()
+                self.pending_deletes = {}
+
+            try:
+                rejected, released = db_pool.run(self._write, inserts, deletes)
+            except Exception:
+                with self.lock:
+                    # Inserções antes das novas operações, para manter a ordem
+                    pending = OrderedDict((record.id, record) for record in inserts)
+                    pending.update(self.pending_inserts)
+                    self.pending_inserts = pending
+                    deletes.update(self.pending_deletes)
+                    self.pending_deletes = deletes
+                raise
+
+        if rejected:
+            # Importado aqui: o agendador de expiração depende do hold_writer
+            from app.utils.expiry_scheduler import expiry_scheduler
+            # O banco recusou (contador esgotado): a reserva deixa de existir
+            with self.lock:
+                for record in rejected:
+                    self._forget(record)
+                    self.pending_deletes.pop(record.id, None)
+            for record in rejected:
+                expiry_scheduler.cancel(record.id)
+                slot_ledger.release_hold(record.event_id)
+                broadcast_event_update(record.event_id)
+                # A sessão já recebeu o modal da reserva: avisa e fecha
+                socketio.emit('error', {
+                    'message': 'Não há mais vagas disponíveis para este evento'
+                }, to=record.session_id)
+                socketio.emit('close_reservation_modal', to=record.session_id)
+            logger.warning('Reservas recusadas pelo banco ao gravar', extra={'count': len(rejected)})
+
+        for event_id, count in released.items():
+            slot_ledger.release_hold(event_id, count)
+            broadcast_event_update(event_id)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception('Erro ao gravar reservas temporárias')
+
+hold_writer = HoldWriter()
@@ -0,0 +1,135 @@
+"""
+Logging assíncrono da aplicação.
+
+Os handlers apenas colocam o registro em uma fila em memória; a formatação e a
+escrita no stdout acontecem em uma thread dedicada (uma thread real também no
+modo eventlet), fora do caminho dos handlers. Se a fila encher, o registro é
+descartado em vez de bloquear. Mensagens frequentes (conexões, entradas na
+fila) podem ser amostradas com extra={'sample': chave}, e os campos
+estruturados (sid, event_id, ...) são anexados ao final da linha.
+"""
+import atexit
+import logging
+import queue
+import sys
+import threading
+from app import socketio
+from app.utils.metrics import metrics
+
+logger = logging.getLogger('eventreserve')
+
+# Campos estruturados aceitos em extra, na ordem em que aparecem na linha
+STRUCTURED_FIELDS = ('sid', 'event_id', 'reservation_id', 'position', 'count')
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def formatMessage(self, record):
+        # Os campos ficam na linha da mensagem, antes de um eventual traceback
+        line = super().formatMessage(record)
+        fields = [
+            f'{field}={getattr(record, field)}'
+            for field in STRUCTURED_FIELDS
+            if getattr(record, field, None) is not None
+        ]
+        if getattr(record, 'sample_rate', 1) > 1:
+            fields.append(f'amostra=1/{record.sample_rate}')
+        return f"{line} {' '.join(fields)}" if fields else line
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar um a cada rate registros de cada chave de amostragem"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(1, int(rate))
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None or self.rate == 1:
+            return True
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        record.sample_rate = self.rate
+        return count % self.rate == 0
+
+class NonBlockingQueueHandler(logging.Handler):
+    """Enfileira o registro sem formatá-lo; descarta quando a fila está cheia"""
+
+    def __init__(self, log_queue, full=queue.Full):
+        super().__init__()
+        self.queue = log_queue
+        self.full = full
+        self.dropped = metrics.counter(
+            'eventreserve_log_dropped_total', 'Registros de log descartados com a fila cheia')
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except self.full:
+            self.dropped.inc()
+
+    def handle(self, record):
+        # Sem o lock do Handler: a fila já é thread-safe
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+class LogPipeline:
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.output = None
+
+    def configure(self, app):
+        """Liga o logger da aplicação à fila e inicia a thread de escrita"""
+        if self.thread is not None:
+            return
+        threading_module, queue_module = threading, queue
+        if socketio.async_mode == 'eventlet':
+            # A escrita no stdout bloqueia: roda em uma thread real, não em uma green thread
+            from eventlet import patcher
+            threading_module = patcher.original('threading')
+            queue_module = patcher.original('queue')
+
+        self.queue = queue_module.Queue(app.config.get('LOG_QUEUE_SIZE', 10000))
+        self.output = logging.StreamHandler(sys.stdout)
+        self.output.setFormatter(StructuredFormatter())
+        # O flush do StreamHandler usa o lock do handler, que deve ser da mesma thread real
+        self.output.lock = threading_module.RLock()
+
+        handler = NonBlockingQueueHandler(self.queue, queue_module.Full)
+        handler.addFilter(SamplingFilter(app.config.get('LOG_SAMPLE_RATE', 100)))
+        logger.handlers = [handler]
+        logger.setLevel(app.config.get('LOG_LEVEL', 'INFO'))
+        logger.propagate = False
+
+        self.thread = threading_module.Thread(target=self._run, name='eventreserve-log', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                # Apenas esta thread escreve, então o lock do handler é dispensado
+                self.output.emit(record)
+            except Exception:
+                pass
+
+    def stop(self):
+        """Escreve os registros pendentes e encerra a thread de escrita"""
+        if self.thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=1)
+        except Exception:
+            return
+        self.thread.join(timeout=2)
+
+log_pipeline = LogPipeline()
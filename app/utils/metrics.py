@@ -0,0 +1,236 @@
+"""
+Métricas internas exportadas no formato texto do Prometheus (/metrics).
+
+Os contadores e histogramas ficam em memória, protegidos por um lock por
+métrica; observar um valor custa uma busca binária e um incremento, o que
+permite deixar a instrumentação ligada em produção. Medidas como o tamanho da
+fila são lidas apenas no momento da coleta.
+"""
+import sys
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from flask import g, request
+from sqlalchemy import event as sqlalchemy_event
+from app import socketio
+
+# As consultas SQL são medidas também nas threads reais do db_pool: no modo
+# eventlet um lock de green thread não pode ser disputado entre threads
+if 'eventlet' in sys.modules:
+    from eventlet.patcher import original
+    Lock = original('threading').Lock
+else:
+    from threading import Lock
+
+# Limites (em segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000, 50000)
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labels, labels)} {value}')
+        return lines
+
+class Gauge:
+    """Valor lido por uma função no momento da coleta"""
+
+    def __init__(self, name, description, function):
+        self.name = name
+        self.description = description
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} gauge', f'{self.name} {value}']
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [contagem por faixa (+Inf no fim), soma, total]
+        self.values = {}
+        self.lock = Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            values = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items()]
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = _format_labels(self.labels + ('le',), labels + (le,))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            series_labels = _format_labels(self.labels, labels)
+            lines.append(f'{self.name}_sum{series_labels} {total}')
+            lines.append(f'{self.name}_count{series_labels} {count}')
+        return lines
+
+class Metrics:
+    def __init__(self):
+        self.metrics = []
+        # Consultas SQL da requisição ou evento em andamento: [quantidade, duração]
+        self.current_sql = ContextVar('current_sql', default=None)
+
+        self.socket_latency = self.histogram(
+            'eventreserve_socket_event_duration_seconds', 'Duração dos handlers do Socket.IO', ('event',))
+        self.socket_sql = self.histogram(
+            'eventreserve_socket_event_sql_queries', 'Consultas SQL por evento do Socket.IO',
+            ('event',), COUNT_BUCKETS)
+        self.http_latency = self.histogram(
+            'eventreserve_http_request_duration_seconds', 'Duração das requisições HTTP', ('route', 'method'))
+        self.http_sql = self.histogram(
+            'eventreserve_http_request_sql_queries', 'Consultas SQL por requisição HTTP',
+            ('route',), COUNT_BUCKETS)
+        self.sql_latency = self.histogram(
+            'eventreserve_sql_query_duration_seconds', 'Duração das consultas SQL')
+        self.http_responses = self.counter(
+            'eventreserve_http_responses_total', 'Respostas HTTP por rota e status', ('route', 'status'))
+        self.holds = self.counter(
+            'eventreserve_holds_total', 'Tentativas de reserva temporária', ('result',))
+        self.confirmations = self.counter(
+            'eventreserve_confirmations_total', 'Confirmações de reserva', ('result',))
+        self.expirations = self.counter(
+            'eventreserve_expired_holds_total', 'Reservas temporárias expiradas')
+        self.broadcast_fanout = self.histogram(
+            'eventreserve_broadcast_fanout_clients', 'Clientes conectados atingidos por broadcast',
+            ('message',), COUNT_BUCKETS)
+        self.broadcast_events = self.histogram(
+            'eventreserve_broadcast_batch_events', 'Eventos por mensagem update_event_slots', (), COUNT_BUCKETS)
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, description, function):
+        metric = Gauge(name, description, function)
+        self.metrics.append(metric)
+        return metric
+
+    @staticmethod
+    def connected_clients():
+        """Sockets conectados a este worker (destinatários de um broadcast)"""
+        server = socketio.server
+        return len(server.eio.sockets) if server is not None else 0
+
+    @staticmethod
+    def room_size(room, namespace='/'):
+        """Sockets deste worker na sala do Socket.IO"""
+        server = socketio.server
+        if server is None:
+            return 0
+        return len(server.manager.rooms.get(namespace, {}).get(room) or ())
+
+    def broadcast(self, message, room=None):
+        """Registra o alcance de um broadcast para todos os clientes ou para uma sala"""
+        fanout = self.connected_clients() if room is None else self.room_size(room)
+        self.broadcast_fanout.observe(fanout, message)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, app, engine):
+        """Registra os ganchos das requisições HTTP e das consultas SQL"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        sqlalchemy_event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        sqlalchemy_event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql_token = self.current_sql.set([0, 0.0])
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        token = g.pop('metrics_sql_token', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'desconhecida'
+        self.http_latency.observe(time.perf_counter() - started, route, request.method)
+        self.http_responses.inc(route, response.status_code)
+        sql = self.current_sql.get()
+        if sql is not None:
+            self.http_sql.observe(sql[0], route)
+        if token is not None:
+            self.current_sql.reset(token)
+        return response
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        self.sql_latency.observe(elapsed)
+        sql = self.current_sql.get()
+        if sql is not None:
+            sql[0] += 1
+            sql[1] += elapsed
+
+    def timed_event(self, handler):
+        """Mede a duração e as consultas SQL de um handler do Socket.IO"""
+        name = handler.__name__.replace('handle_', '', 1)
+
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            token = self.current_sql.set([0, 0.0])
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self.socket_latency.observe(time.perf_counter() - started, name)
+                self.socket_sql.observe(self.current_sql.get()[0], name)
+                self.current_sql.reset(token)
+        return wrapper
+
+metrics = Metrics()
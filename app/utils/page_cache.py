@@ -0,0 +1,60 @@
+import hashlib
+from collections import namedtuple
+from datetime import datetime, UTC
+from threading import Lock
+from app.events.state_backend import get_state_backend
+
+CachedPage = namedtuple('CachedPage', ['body', 'etag', 'last_modified', 'version'])
+
+class PageCache:
+    """
+    Cache das páginas públicas já renderizadas.
+
+    Cada página é guardada junto com a versão do catálogo de eventos em que foi
+    gerada. Criar, editar ou excluir um evento incrementa a versão (no backend
+    de estado, compartilhada entre workers) e a página é renderizada de novo
+    no próximo acesso. As vagas de cada evento chegam pelo socket, então o HTML
+    não precisa ser refeito a cada reserva.
+    """
+
+    def __init__(self):
+        self.pages = {}
+        # Garante que apenas uma requisição renderize a página por vez
+        self.lock = Lock()
+        self.catalog = None
+
+    def _catalog(self):
+        if self.catalog is None:
+            self.catalog = get_state_backend().hash('catalog')
+        return self.catalog
+
+    def catalog_version(self):
+        return self._catalog().get('version', 0)
+
+    def bump_catalog(self):
+        """Invalida as páginas após uma alteração no catálogo de eventos"""
+        with get_state_backend().transaction():
+            self._catalog()['version'] = self.catalog_version() + 1
+
+    def get(self, name, render):
+        """Retorna a página em cache ou a renderiza com render() se estiver desatualizada"""
+        version = self.catalog_version()
+        page = self.pages.get(name)
+        if page and page.version == version:
+            return page
+
+        with self.lock:
+            page = self.pages.get(name)
+            if page and page.version == version:
+                return page
+            body = render().encode('utf-8')
+            page = CachedPage(
+                body,
+                hashlib.sha1(body).hexdigest(),
+                datetime.now(UTC).replace(microsecond=0),
+                version
+            )
+            self.pages[name] = page
+        return page
+
+page_cache = PageCache()
@@ -0,0 +1,79 @@
+import time
+from functools import wraps
+from threading import Lock
+from flask import request
+from flask_socketio import emit
+from app.utils.settings_cache import settings_cache
+
+class RateLimiter:
+    """
+    Limitador por token bucket mantido em memória.
+
+    Cada chave (sid ou IP) tem um balde com até burst fichas, reabastecido a
+    rate fichas por segundo. Os baldes guardam apenas (fichas, instante) e são
+    descartados quando ficam cheios, então o custo é O(1) por verificação.
+    """
+    # Verificações entre duas limpezas dos baldes ociosos
+    PRUNE_EVERY = 10000
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = Lock()
+        self.calls = 0
+
+    def allow(self, key, rate, burst, cost=1):
+        """Consome cost fichas do balde da chave. Retorna False se não houver fichas"""
+        if rate <= 0:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            self.calls += 1
+            if self.calls % self.PRUNE_EVERY == 0:
+                self._prune(now, rate, burst)
+
+            bucket = self.buckets.get(key)
+            tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if tokens < cost:
+                self.buckets[key] = (tokens, now)
+                return False
+            self.buckets[key] = (tokens - cost, now)
+            return True
+
+    def forget(self, key):
+        with self.lock:
+            self.buckets.pop(key, None)
+
+    def _prune(self, now, rate, burst):
+        """Remove os baldes que já estariam cheios (equivalem a um balde novo)"""
+        idle = burst / rate
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if now - bucket[1] < idle
+        }
+
+sid_limiter = RateLimiter()
+ip_limiter = RateLimiter()
+
+def allow_socket_request():
+    """Verifica os limites do sid e do IP da requisição atual"""
+    settings = settings_cache.get()
+    if not sid_limiter.allow(request.sid, settings.socket_rate_limit, settings.socket_burst_limit):
+        return False
+    return ip_limiter.allow(request.remote_addr, settings.ip_rate_limit, settings.ip_burst_limit)
+
+def rate_limited(handler):
+    """
+    Aplica o limite de requisições a um handler do Socket.IO.
+
+    A verificação acontece antes do handler, então requisições acima do
+    limite são recusadas sem tocar no banco. Uma conexão acima do limite é
+    rejeitada; nos demais eventos o cliente recebe um erro.
+    """
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        if allow_socket_request():
+            return handler(*args, **kwargs)
+        if request.event['message'] == 'connect':
+            return False
+        emit('error', {'message': 'Muitas requisições. Aguarde um instante e tente novamente.'})
+    return wrapper
@@ -0,0 +1,174 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, UTC
+from app import db
+from app.models import Event, Reservation
+from app.events.slot_ledger import slot_ledger
+from app.utils.db_pool import db_pool
+from app.utils.expiry_scheduler import expiry_scheduler
+from app.utils.hold_writer import hold_writer, as_utc
+from app.utils.metrics import metrics
+
+# Limite de segurança para o tempo de escolha (em segundos)
+MAX_CHOICE_TIMEOUT = 300
+DEFAULT_CHOICE_TIMEOUT = 120
+
+Hold = namedtuple('Hold', ['id', 'event_id', 'created_at', 'expires_at'])
+
+def normalize_choice_timeout(choice_timeout):
+    """Garante um tempo de escolha válido, em segundos"""
+    if not choice_timeout or choice_timeout > MAX_CHOICE_TIMEOUT:
+        return DEFAULT_CHOICE_TIMEOUT
+    return choice_timeout
+
+def _delete_hold(reservation_id, event_id, session_id):
+    query = Reservation.query.filter_by(status='temporary')
+    if reservation_id is not None:
+        query = query.filter_by(id=reservation_id)
+    if event_id is not None:
+        query = query.filter_by(event_id=event_id)
+    if session_id is not None:
+        query = query.filter_by(session_id=session_id)
+
+    reservation = query.first()
+    if not reservation:
+        return None
+
+    hold = Hold(
+        reservation.id,
+        reservation.event_id,
+        as_utc(reservation.created_at),
+        as_utc(reservation.expires_at)
+    )
+    try:
+        # O filtro por status evita remover uma reserva confirmada nesse meio tempo
+        deleted = Reservation.query.filter_by(
+            id=reservation.id,
+            status='temporary'
+        ).delete(synchronize_session=False)
+        if deleted:
+            Event.release_slots(hold.event_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return hold if deleted else None
+
+def _confirm_hold(event_id, session_id, user_name, user_phone):
+    reservation = Reservation.query.filter_by(
+        event_id=event_id,
+        session_id=session_id,
+        status='temporary'
+    ).first()
+    if not reservation:
+        return None, None, None
+
+    reservation_id = reservation.id
+    expires_at = as_utc(reservation.expires_at)
+    try:
+        if expires_at and datetime.now(UTC) > expires_at:
+            deleted = Reservation.query.filter_by(
+                id=reservation_id,
+                status='temporary'
+            ).delete(synchronize_session=False)
+            if deleted:
+                Event.release_slots(event_id)
+            db.session.commit()
+            return ('expired' if deleted else None), reservation_id, None
+
+        confirmed = Reservation.query.filter_by(
+            id=reservation_id,
+            status='temporary'
+        ).update({
+            'status': 'confirmed',
+            'user_name': user_name,
+            'user_phone': user_phone,
+            'expires_at': None
+        }, synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not confirmed:
+        return None, reservation_id, None
+    event_name = db.session.query(Event.name).filter(Event.id == event_id).scalar()
+    return 'confirmed', reservation_id, event_name
+
+def allocate_hold(event_id, session_id, choice_timeout, user_name=None, user_phone=None):
+    """
+    Aloca uma vaga temporária para a sessão.
+
+    A vaga é reivindicada de forma atômica no livro-razão (lock por faixa do
+    evento) e a reserva fica em memória; a gravação no banco acontece em lote
+    pelo hold_writer. Cada sessão tem no máximo uma reserva temporária por
+    evento: um pedido repetido retorna a reserva existente. Retorna o Hold ou
+    None se o evento estiver esgotado.
+    """
+    expires_at = datetime.now(UTC) + timedelta(seconds=normalize_choice_timeout(choice_timeout))
+    record, created = hold_writer.create_once(
+        event_id, session_id, expires_at,
+        lambda: slot_ledger.try_hold(event_id),
+        user_name, user_phone
+    )
+    if record is None:
+        metrics.holds.inc('sold_out')
+        return None
+    if not created:
+        metrics.holds.inc('reused')
+        return Hold(record.id, record.event_id, record.created_at, record.expires_at)
+
+    expiry_scheduler.schedule(record.id, record.event_id, expires_at)
+    metrics.holds.inc('granted')
+    return Hold(record.id, record.event_id, record.created_at, record.expires_at)
+
+def cancel_hold(reservation_id=None, event_id=None, session_id=None):
+    """
+    Remove uma reserva temporária e devolve a vaga ao livro-razão.
+    Retorna o Hold removido ou None se não houver reserva temporária.
+    """
+    record = hold_writer.pop(reservation_id, event_id, session_id)
+    if record is None:
+        # Reserva mantida por outro worker: remove direto no banco
+        hold = db_pool.run(_delete_hold, reservation_id, event_id, session_id)
+        if hold:
+            expiry_scheduler.cancel(hold.id)
+            slot_ledger.release_hold(hold.event_id)
+        return hold
+
+    expiry_scheduler.cancel(record.id)
+    hold_writer.delete(record)
+    return Hold(record.id, record.event_id, record.created_at, record.expires_at)
+
+def confirm_hold(event_id, session_id, user_name, user_phone):
+    """
+    Confirma a reserva temporária da sessão.
+
+    A confirmação é gravada de forma síncrona: as reservas pendentes são
+    gravadas antes, para que a reserva exista no banco.
+
+    Retorna ('confirmed', nome_do_evento), ('expired', None) quando o prazo já
+    passou (a reserva é removida) ou (None, None) se não houver reserva.
+    """
+    record = hold_writer.pop(event_id=event_id, session_id=session_id)
+    if record is not None:
+        expiry_scheduler.cancel(record.id)
+
+    try:
+        hold_writer.flush()
+        status, reservation_id, event_name = db_pool.run(
+            _confirm_hold, event_id, session_id, user_name, user_phone
+        )
+    except Exception:
+        if record is not None:
+            hold_writer.restore(record)
+            expiry_scheduler.schedule(record.id, record.event_id, record.expires_at)
+        raise
+
+    if reservation_id is not None:
+        expiry_scheduler.cancel(reservation_id)
+    metrics.confirmations.inc(status or 'not_found')
+    if status == 'confirmed':
+        slot_ledger.confirm_hold(event_id)
+    elif status == 'expired':
+        slot_ledger.release_hold(event_id)
+    return status, event_name
@@ -0,0 +1,77 @@
+import time
+from collections import namedtuple
+from threading import Lock
+from app.models import Settings
+from app.utils.db_pool import db_pool
+
+SettingsSnapshot = namedtuple('SettingsSnapshot', [
+    'max_users',
+    'choice_timeout',
+    'queue_timeout',
+    'max_events',
+    'socket_rate_limit',
+    'socket_burst_limit',
+    'ip_rate_limit',
+    'ip_burst_limit',
+    'admission_rate',
+    'version'
+])
+
+class SettingsCache:
+    """
+    Cache versionado das configurações.
+
+    O caminho quente lê as configurações da memória. A rota /update_settings
+    invalida o cache explicitamente e o TTL cobre alterações feitas por outros
+    processos. A versão só muda quando algum valor realmente muda.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.snapshot = None
+        self.loaded_at = 0
+        self.lock = Lock()
+
+    def configure(self, app):
+        self.ttl = app.config.get('SETTINGS_CACHE_TTL', self.ttl)
+
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return snapshot
+        return self._reload()
+
+    @staticmethod
+    def _load():
+        settings = Settings.get_settings()
+        return (
+            settings.max_users,
+            settings.choice_timeout,
+            settings.queue_timeout,
+            settings.max_events,
+            settings.socket_rate_limit or 0,
+            settings.socket_burst_limit or 0,
+            settings.ip_rate_limit or 0,
+            settings.ip_burst_limit or 0,
+            settings.admission_rate or 0
+        )
+
+    def _reload(self):
+        with self.lock:
+            # Quem esperou o lock usa a releitura feita por quem chegou antes
+            if self.snapshot is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return self.snapshot
+            values = db_pool.run(self._load)
+            current = self.snapshot
+            if current is None or tuple(current[:-1]) != values:
+                version = current.version + 1 if current else 1
+                self.snapshot = SettingsSnapshot(*values, version)
+            self.loaded_at = time.monotonic()
+            return self.snapshot
+
+    def invalidate(self):
+        """Força a releitura do banco no próximo acesso"""
+        with self.lock:
+            self.loaded_at = 0
+
+settings_cache = SettingsCache()
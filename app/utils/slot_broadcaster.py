@@ -0,0 +1,56 @@
+from threading import Lock
+from app import socketio
+from app.events.slot_ledger import slot_ledger
+from app.utils.metrics import metrics
+from app.utils.log import logger
+
+class SlotBroadcaster:
+    """
+    Agrupa as atualizações de vagas e as envia em lote.
+
+    Os eventos alterados são marcados como "sujos" e, a cada intervalo, uma
+    única mensagem update_event_slots com todos eles é enviada aos clientes.
+    """
+
+    def __init__(self):
+        self.dirty = set()
+        self.lock = Lock()
+        self.interval = 0.1
+        self.started = False
+
+    def start(self, app):
+        if self.started:
+            return
+        self.started = True
+        self.interval = app.config.get('SLOT_BROADCAST_INTERVAL', self.interval)
+        socketio.start_background_task(self._run)
+
+    def mark_dirty(self, event_id):
+        with self.lock:
+            self.dirty.add(event_id)
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            event_ids, self.dirty = self.dirty, set()
+
+        snapshots = [snapshot for snapshot in map(slot_ledger.snapshot, event_ids) if snapshot]
+        if snapshots:
+            socketio.emit('update_event_slots', {'events': snapshots})
+            metrics.broadcast('update_event_slots')
+            metrics.broadcast_events.observe(len(snapshots))
+
+    def send_snapshot(self, sid):
+        """Envia o estado atual de todos os eventos apenas para um cliente"""
+        socketio.emit('update_event_slots', {'events': slot_ledger.snapshot_all()}, to=sid)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Erro ao enviar atualização de vagas')
+
+slot_broadcaster = SlotBroadcaster()
@@ -0,0 +1,95 @@
+"""
+Memória ocupada pelo estado de cada conexão.
+
+Simula N conexões passando pelas mesmas chamadas do handle_connect e do
+browser_info (presença, entrada na sala de espera e informações do navegador,
+decodificadas de um JSON como o Socket.IO faz) e mede com tracemalloc os bytes
+retidos pelo EventsManager e pela presença, por conexão. Os sids são gerados
+antes da medição, pois pertencem ao Socket.IO. Usa o backend em memória.
+
+Uso:
+    python benchmarks/connection_memory.py --connections 50000 --max-users 100
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Combinações enviadas pelo getBrowserInfo() de index.html
+BROWSERS = [
+    ('Chrome', 'fab fa-chrome', 'Windows'),
+    ('Chrome', 'fab fa-chrome', 'Android'),
+    ('Safari', 'fab fa-safari', 'iOS'),
+    ('Firefox', 'fab fa-firefox', 'Linux'),
+    ('Edge', 'fab fa-edge', 'Windows'),
+]
+
+def random_sid():
+    return ''.join(random.choices(string.ascii_letters + string.digits + '-_', k=20))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=50000)
+    parser.add_argument('--max-users', type=int, default=100)
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix='eventreserve-memory-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(db_dir, 'memory.db')}"
+    os.environ['STATE_BACKEND'] = 'memory'
+
+    from app import app, db
+    from app.models import Event, Settings
+    from app.events.events_manager import events_manager
+    from app.events.presence import presence
+    from app.events.slot_ledger import slot_ledger
+    from app.utils.settings_cache import settings_cache
+
+    with app.app_context():
+        settings = Settings.query.first() or Settings()
+        settings.max_users = args.max_users
+        db.session.add(settings)
+        event = Event(name='Memória', total_slots=10, available_slots=10, date=datetime.now() + timedelta(days=1))
+        db.session.add(event)
+        db.session.commit()
+        event_id = event.id
+        slot_ledger.set_total(event_id, 10)
+        settings_cache.invalidate()
+
+        key = events_manager.room_key(event_id)
+        # Aquece a sala e a fila para medir só o custo marginal de cada conexão
+        events_manager.add_user('aquecimento', key)
+        events_manager.remove_user('aquecimento')
+
+        sids = [random_sid() for _ in range(args.connections)]
+        payloads = [
+            json.dumps(dict(zip(('browser', 'icon', 'platform'), random.choice(BROWSERS))))
+            for _ in range(args.connections)
+        ]
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for sid, payload in zip(sids, payloads):
+            presence.connect(sid)
+            events_manager.add_user(sid, key)
+            events_manager.set_user_browser_info(sid, json.loads(payload))
+        del payloads
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    room = events_manager.room(key)
+    print(f"conexões={args.connections} com_acesso={len(room.active_users)} na_fila={len(room.waiting_queue)}")
+    print(f"bytes_por_conexão={(after - before) / args.connections:.0f}")
+
+if __name__ == '__main__':
+    main()
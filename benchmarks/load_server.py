@@ -0,0 +1,85 @@
+"""
+Servidor usado pelo teste de carga (benchmarks/load_test.py).
+
+Sobe a aplicação como o server.py (eventlet), cria os eventos e as
+configurações do cenário e conta as consultas SQL executadas, expondo o total
+em /_bench/stats. Não deve ser usado fora dos benchmarks.
+
+Variáveis de ambiente: PORT, DATABASE_URL, BENCH_EVENTS, BENCH_SLOTS,
+BENCH_MAX_USERS, BENCH_CHOICE_TIMEOUT.
+"""
+import os
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'eventlet')
+
+import eventlet
+eventlet.monkey_patch()
+
+import sys
+from datetime import datetime, timedelta
+from threading import Lock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import jsonify
+from sqlalchemy import event as sqlalchemy_event
+from app import app, db, socketio
+from app.models import Event, Settings
+from app.events.slot_ledger import slot_ledger
+from app.utils.settings_cache import settings_cache
+from server import raise_file_limit
+
+query_count = {'total': 0}
+query_lock = Lock()
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    with query_lock:
+        query_count['total'] += 1
+
+def seed():
+    """Cria os eventos do cenário e ajusta as configurações da fila"""
+    events = int(os.environ.get('BENCH_EVENTS', 10))
+    slots = int(os.environ.get('BENCH_SLOTS', 100))
+
+    settings = Settings.get_settings()
+    settings.max_users = int(os.environ.get('BENCH_MAX_USERS', 100000))
+    settings.choice_timeout = int(os.environ.get('BENCH_CHOICE_TIMEOUT', 120))
+    settings.queue_timeout = 3600
+    settings.max_events = events
+    # Todos os clientes simulados vêm do mesmo IP
+    settings.ip_rate_limit = 0
+
+    created = []
+    for index in range(events):
+        event = Event(
+            name=f'Carga {index + 1}',
+            total_slots=slots,
+            available_slots=slots,
+            date=datetime.now() + timedelta(days=30)
+        )
+        db.session.add(event)
+        created.append(event)
+    db.session.commit()
+
+    for event in created:
+        slot_ledger.set_total(event.id, event.total_slots)
+    settings_cache.invalidate()
+
+@app.route('/_bench/stats')
+def bench_stats():
+    with query_lock:
+        return jsonify(queries=query_count['total'])
+
+if __name__ == '__main__':
+    with app.app_context():
+        seed()
+        sqlalchemy_event.listen(db.engine, 'before_cursor_execute', count_query)
+
+    raise_file_limit()
+    socketio.run(app,
+        host='127.0.0.1',
+        port=int(os.environ.get('PORT', 5055)),
+        debug=False,
+        log_output=False,
+        max_size=app.config['SERVER_MAX_CONNECTIONS']
+    )
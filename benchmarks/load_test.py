@@ -0,0 +1,296 @@
+"""
+Teste de carga do fluxo de reservas pelo protocolo Socket.IO.
+
+Sobe um servidor local (benchmarks/load_server.py) com um banco SQLite novo e
+simula milhares de clientes seguindo o protocolo de app/sockets.py, em fases:
+
+    connect -> reserve_event -> confirm_reservation / cancel_reservation
+            -> interaction_timeout -> disconnect
+
+Para cada tipo de evento informa a vazão, a latência p50/p99 (do envio até a
+resposta do servidor), as consultas SQL por operação e, ao final, se alguma
+vaga foi vendida acima da capacidade. Respostas 'error' do servidor (ex.:
+evento esgotado) e respostas que não chegam a tempo contam como erros. A saída
+do servidor fica em server.log, no diretório temporário do teste.
+
+Requer o cliente assíncrono do python-socketio:
+
+    pip install "python-socketio[asyncio_client]"
+
+Uso:
+    python benchmarks/load_test.py --clients 2000 --events 10 --slots 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import socketio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, 'benchmarks', 'load_server.py')
+
+# Respostas do servidor que encerram cada operação
+RESPONSES = {
+    'connect': ('session',),
+    'reserve_event': ('show_reservation_modal', 'error'),
+    'confirm_reservation': ('reservation_success', 'error'),
+    'cancel_reservation': ('reservation_cancelled', 'error'),
+    'interaction_timeout': ('moved_to_queue',),
+}
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.phases = {}
+
+    def record(self, operation, latency):
+        self.latencies.setdefault(operation, []).append(latency)
+
+    def error(self, operation):
+        self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    @staticmethod
+    def percentile(values, fraction):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class BenchClient:
+    """Cliente simulado que espera a resposta de cada evento enviado"""
+
+    def __init__(self, index, stats, timeout):
+        self.index = index
+        self.stats = stats
+        self.timeout = timeout
+        self.pending = None
+        self.hold = None
+        self.confirmed_event = None
+        self.sio = socketio.AsyncClient(reconnection=False)
+        names = {name for responses in RESPONSES.values() for name in responses}
+        for name in names:
+            self.sio.on(name, self._handler(name))
+
+    def _handler(self, name):
+        async def handler(data=None):
+            if self.pending and name in self.pending[0] and not self.pending[1].done():
+                self.pending[1].set_result((name, data))
+        return handler
+
+    async def _request(self, operation, send):
+        future = asyncio.get_running_loop().create_future()
+        self.pending = (RESPONSES[operation], future)
+        started = time.perf_counter()
+        try:
+            await send()
+            name, data = await asyncio.wait_for(future, self.timeout)
+        except Exception:
+            self.stats.error(operation)
+            return None, None
+        finally:
+            self.pending = None
+        self.stats.record(operation, time.perf_counter() - started)
+        if name == 'error':
+            self.stats.error(operation)
+        return name, data
+
+    async def connect(self, url):
+        return await self._request('connect', lambda: self.sio.connect(url, transports=['websocket'], wait_timeout=self.timeout))
+
+    async def reserve(self, event_id):
+        name, data = await self._request(
+            'reserve_event',
+            lambda: self.sio.emit('reserve_event', {'event_id': event_id})
+        )
+        if name == 'show_reservation_modal':
+            self.hold = data
+        return name
+
+    async def finish_hold(self, confirm):
+        if not self.hold:
+            return None
+        event_id = self.hold['event_id']
+        if confirm:
+            name, _ = await self._request('confirm_reservation', lambda: self.sio.emit('confirm_reservation', {
+                'event_id': event_id,
+                'user_name': f'Cliente {self.index}',
+                'user_phone': f'{self.index:011d}'
+            }))
+            if name == 'reservation_success':
+                self.confirmed_event = event_id
+        else:
+            await self._request('cancel_reservation', lambda: self.sio.emit('cancel_reservation', {
+                'event_id': event_id,
+                'reservation_id': self.hold['reservation_id']
+            }))
+        self.hold = None
+
+    async def interaction_timeout(self):
+        await self._request('interaction_timeout', lambda: self.sio.emit('interaction_timeout'))
+
+    async def disconnect(self):
+        started = time.perf_counter()
+        try:
+            await self.sio.disconnect()
+        except Exception:
+            self.stats.error('disconnect')
+            return
+        self.stats.record('disconnect', time.perf_counter() - started)
+
+def fetch_queries(base_url):
+    with urllib.request.urlopen(f'{base_url}/_bench/stats', timeout=10) as response:
+        return json.load(response)['queries']
+
+def wait_for_server(base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('O servidor de carga encerrou durante a inicialização')
+        try:
+            return fetch_queries(base_url)
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('O servidor de carga não respondeu a tempo')
+
+async def run_phase(name, clients, action, stats, base_url, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(client):
+        async with semaphore:
+            await action(client)
+
+    queries_before = await asyncio.to_thread(fetch_queries, base_url)
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(client) for client in clients))
+    elapsed = time.perf_counter() - started
+    # Dá tempo para as tarefas em lote do servidor (broadcasts, expiração) rodarem
+    await asyncio.sleep(0.3)
+    queries = await asyncio.to_thread(fetch_queries, base_url) - queries_before
+    stats.phases[name] = (elapsed, queries)
+
+async def simulate(args, base_url, stats):
+    clients = [BenchClient(index, stats, args.timeout) for index in range(args.clients)]
+    event_ids = list(range(1, args.events + 1))
+    rng = random.Random(args.seed)
+    confirm = {client.index: rng.random() < args.confirm_ratio for client in clients}
+
+    phases = [
+        ('connect', lambda client: client.connect(base_url)),
+        ('reserve_event', lambda client: client.reserve(rng.choice(event_ids))),
+        ('confirm_reservation', lambda client: client.finish_hold(True) if confirm[client.index] else asyncio.sleep(0)),
+        ('cancel_reservation', lambda client: client.finish_hold(False)),
+        ('interaction_timeout', lambda client: client.interaction_timeout()),
+        ('disconnect', lambda client: client.disconnect()),
+    ]
+    for name, action in phases:
+        await run_phase(name, clients, action, stats, base_url, args.concurrency)
+        print(f"  fase {name} concluída")
+
+    confirmed = {}
+    for client in clients:
+        if client.confirmed_event is not None:
+            confirmed[client.confirmed_event] = confirmed.get(client.confirmed_event, 0) + 1
+    return confirmed
+
+def count_oversell(db_path, confirmed_by_clients):
+    """Compara as reservas gravadas e as confirmações recebidas com o total de vagas"""
+    connection = sqlite3.connect(db_path)
+    rows = connection.execute("""
+        SELECT e.id, e.total_slots, COUNT(r.id)
+        FROM event e LEFT JOIN reservation r
+            ON r.event_id = e.id AND r.status IN ('temporary', 'confirmed')
+        GROUP BY e.id
+    """).fetchall()
+    connection.close()
+
+    oversold = 0
+    for event_id, total_slots, stored in rows:
+        taken = max(stored, confirmed_by_clients.get(event_id, 0))
+        oversold += max(0, taken - total_slots)
+    return oversold, sum(stored for _, _, stored in rows)
+
+def report(stats, args):
+    print()
+    print(f"{'evento':<22}{'ops':>7}{'erros':>7}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'SQL/op':>9}")
+    for name, (elapsed, queries) in stats.phases.items():
+        latencies = stats.latencies.get(name, [])
+        operations = len(latencies)
+        if operations:
+            p50 = Stats.percentile(latencies, 0.50) * 1000
+            p99 = Stats.percentile(latencies, 0.99) * 1000
+            print(f"{name:<22}{operations:>7}{stats.errors.get(name, 0):>7}"
+                  f"{operations / elapsed:>10.1f}{p50:>10.2f}{p99:>10.2f}{queries / operations:>9.2f}")
+        else:
+            print(f"{name:<22}{0:>7}{stats.errors.get(name, 0):>7}{'-':>10}{'-':>10}{'-':>10}{'-':>9}")
+
+def raise_file_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--events', type=int, default=10)
+    parser.add_argument('--slots', type=int, default=100, help='vagas por evento')
+    parser.add_argument('--max-users', type=int, default=None,
+                        help='sessões ativas simultâneas (padrão: todos os clientes)')
+    parser.add_argument('--confirm-ratio', type=float, default=0.5,
+                        help='fração dos clientes com reserva que confirmam (os demais cancelam)')
+    parser.add_argument('--concurrency', type=int, default=50, help='operações simultâneas por fase')
+    parser.add_argument('--timeout', type=float, default=30.0, help='espera máxima por resposta (s)')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    raise_file_limit()
+    work_dir = tempfile.mkdtemp(prefix='eventreserve-load-')
+    db_path = os.path.join(work_dir, 'load.db')
+    env = dict(os.environ,
+        PORT=str(args.port),
+        DATABASE_URL=f'sqlite:///{db_path}',
+        STATE_BACKEND_PATH=os.path.join(work_dir, 'state.db'),
+        BENCH_EVENTS=str(args.events),
+        BENCH_SLOTS=str(args.slots),
+        BENCH_MAX_USERS=str(args.max_users or args.clients)
+    )
+    base_url = f'http://127.0.0.1:{args.port}'
+
+    print(f"clientes={args.clients} eventos={args.events} vagas/evento={args.slots} banco={db_path}")
+    log_path = os.path.join(work_dir, 'server.log')
+    log = open(log_path, 'w')
+    server = subprocess.Popen([sys.executable, SERVER], env=env, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_for_server(base_url, server)
+        stats = Stats()
+        started = time.perf_counter()
+        confirmed = asyncio.run(simulate(args, base_url, stats))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        log.close()
+
+    report(stats, args)
+    oversold, stored = count_oversell(db_path, confirmed)
+    total_ops = sum(len(values) for values in stats.latencies.values())
+    print()
+    print(f"tempo_total={elapsed:.2f}s vazão_total={total_ops / elapsed:.1f} ops/s")
+    print(f"reservas_gravadas={stored} confirmadas={sum(confirmed.values())} excedente={oversold}")
+    print(f"log do servidor: {log_path}")
+
+    if oversold:
+        print('FALHA: vagas vendidas acima da capacidade')
+        sys.exit(1)
+    print('OK')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Compara a vazão de gravação de reservas com e sem o perfil de ajustes do SQLite.
+
+Para cada perfil cria um banco novo e dispara várias threads gravando reservas
+temporárias como o hold_writer faz (UPDATE condicional do contador do evento +
+INSERT, cada uma em sua transação) e em seguida confirmando-as. Informa as
+transações por segundo, os erros "database is locked" e a latência p99.
+
+    padrao:  engine sem opções (journal DELETE, synchronous FULL, pool padrão)
+    ajustado: app/utils/database.py (WAL, synchronous NORMAL, mmap, busy_timeout, pool)
+
+Uso:
+    python benchmarks/sqlite_tuning.py --threads 16 --operations 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, UTC
+from threading import Barrier, Lock, Thread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def run_profile(name, options, configure, args, models):
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import sessionmaker
+
+    db, Event, Reservation = models
+    db_dir = tempfile.mkdtemp(prefix=f'eventreserve-sqlite-{name}-')
+    url = f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+    engine = create_engine(url, **options(url))
+    configure(engine)
+    db.metadata.create_all(engine)
+
+    Session = sessionmaker(bind=engine)
+    total = args.threads * args.operations
+    with Session() as session:
+        session.execute(insert(Event), [{
+            'name': 'Bench',
+            'total_slots': total,
+            'available_slots': total,
+            'date': datetime.now()
+        }])
+        session.commit()
+
+    results = {'ok': 0, 'locked': 0, 'latencies': []}
+    results_lock = Lock()
+    barrier = Barrier(args.threads)
+
+    def transaction(session, work):
+        started = time.perf_counter()
+        try:
+            work(session)
+            session.commit()
+        except OperationalError:
+            session.rollback()
+            with results_lock:
+                results['locked'] += 1
+            return
+        latency = time.perf_counter() - started
+        with results_lock:
+            results['ok'] += 1
+            results['latencies'].append(latency)
+
+    def worker(index):
+        expires_at = datetime.now(UTC) + timedelta(minutes=5)
+        with Session() as session:
+            barrier.wait()
+            for operation in range(args.operations):
+                session_id = f'bench-{index}-{operation}'
+
+                def hold(session):
+                    session.query(Event).filter(
+                        Event.id == 1,
+                        Event.available_slots >= 1
+                    ).update({Event.available_slots: Event.available_slots - 1}, synchronize_session=False)
+                    session.execute(insert(Reservation), [{
+                        'event_id': 1,
+                        'session_id': session_id,
+                        'status': 'temporary',
+                        'expires_at': expires_at
+                    }])
+
+                def confirm(session):
+                    session.query(Reservation).filter_by(
+                        event_id=1,
+                        session_id=session_id,
+                        status='temporary'
+                    ).update({'status': 'confirmed', 'expires_at': None}, synchronize_session=False)
+
+                transaction(session, hold)
+                transaction(session, confirm)
+
+    threads = [Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+
+    latencies = sorted(results['latencies'])
+    p99 = latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000 if latencies else 0
+    print(f"{name:<10}{results['ok']:>8}{results['locked']:>10}{results['ok'] / elapsed:>12.1f}{p99:>10.2f}")
+    return results['ok'] / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--operations', type=int, default=200, help='reservas por thread')
+    args = parser.parse_args()
+
+    # O app é carregado só pelos modelos; usa um banco temporário descartável
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='eventreserve-app-'), 'app.db')}"
+    from app import app, db
+    from app.models import Event, Reservation
+    from app.utils.database import engine_options, configure_engine
+
+    config = dict(app.config)
+    models = (db, Event, Reservation)
+
+    print(f"threads={args.threads} reservas/thread={args.operations}")
+    print(f"{'perfil':<10}{'tx ok':>8}{'locked':>10}{'tx/s':>12}{'p99 ms':>10}")
+    before = run_profile('padrao', lambda url: {}, lambda engine: None, args, models)
+    after = run_profile(
+        'ajustado',
+        lambda url: engine_options(dict(config, SQLALCHEMY_DATABASE_URI=url, SQLALCHEMY_ENGINE_OPTIONS={})),
+        lambda engine: configure_engine(engine, config),
+        args,
+        models
+    )
+    print(f"ganho={after / before:.2f}x" if before else 'ganho=-')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Teste de estresse da alocação de vagas temporárias.
+
+Dispara muitas threads reservando o mesmo evento ao mesmo tempo e verifica
+que o número de reservas gravadas nunca ultrapassa o total de vagas e que
+cada reserva recebe um id próprio. Com mais de 1000 reservas (HoldWriter.ID_BLOCK)
+o teste cobre também a troca de bloco de ids.
+
+Uso:
+    python benchmarks/stress_allocation.py --threads 2000 --slots 50
+    python benchmarks/stress_allocation.py --threads 2500 --slots 2500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from threading import Barrier, Lock, Thread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=2000)
+    parser.add_argument('--slots', type=int, default=50)
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix='eventreserve-stress-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(db_dir, 'stress.db')}"
+
+    from app import app, db
+    from app.models import Event, Reservation
+    from app.events.slot_ledger import slot_ledger
+    from app.utils.reservation_allocator import allocate_hold
+    from app.utils.hold_writer import hold_writer
+
+    with app.app_context():
+        event = Event(name='Stress', total_slots=args.slots, available_slots=args.slots, date=datetime.now())
+        db.session.add(event)
+        db.session.commit()
+        event_id = event.id
+        slot_ledger.set_total(event_id, args.slots)
+
+    results = {'held': 0, 'sold_out': 0, 'errors': 0}
+    hold_ids = set()
+    results_lock = Lock()
+    barrier = Barrier(args.threads)
+
+    def worker(index):
+        with app.app_context():
+            barrier.wait()
+            try:
+                hold = allocate_hold(event_id, f'stress-{index}', 60)
+                outcome = 'held' if hold else 'sold_out'
+            except Exception:
+                hold = None
+                outcome = 'errors'
+        with results_lock:
+            results[outcome] += 1
+            if hold:
+                hold_ids.add(hold.id)
+
+    threads = [Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        # As reservas temporárias são gravadas em lote; grava o que estiver pendente
+        hold_writer.flush()
+        stored = Reservation.query.filter_by(event_id=event_id).count()
+        ledger = slot_ledger.snapshot(event_id)
+
+    oversold = max(0, stored - args.slots)
+    print(f"threads={args.threads} slots={args.slots} tempo={elapsed:.3f}s")
+    print(f"reservadas={results['held']} esgotado={results['sold_out']} erros={results['errors']}")
+    print(f"gravadas_no_banco={stored} livro_razao={ledger['reservation_count']} excedente={oversold} ids_distintos={len(hold_ids)}")
+
+    if oversold or stored != ledger['reservation_count'] or results['held'] != stored \
+            or len(hold_ids) != results['held'] or results['errors']:
+        print('FALHA: contagem inconsistente, ids repetidos ou venda acima da capacidade')
+        sys.exit(1)
+    print('OK')
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,38 @@ class Config:
         'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Pool de conexões (para SQLite em arquivo e demais bancos)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 10)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 20)
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 30)
+    # Apenas para bancos em servidor (PostgreSQL, MySQL...)
+    DB_POOL_PRE_PING = True
+    DB_POOL_RECYCLE = 1800
+    
+    # Ajustes do SQLite aplicados a cada conexão
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000)
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE = -20000
+    
+    # Estado da fila e das vagas: 'memory' (um único processo) ou
+    # 'sqlite' (arquivo compartilhado entre vários workers)
+    STATE_BACKEND = os.environ.get('STATE_BACKEND') or 'memory'
+    STATE_BACKEND_PATH = os.environ.get('STATE_BACKEND_PATH') or 'instance/state.db'
+    
+    # Modo assíncrono do Socket.IO: 'threading' (desenvolvimento) ou 'eventlet' (produção)
+    SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or 'threading'
+    
+    # Threads reservadas para o trabalho de banco de dados dos handlers
+    DB_WORKER_POOL_SIZE = int(os.environ.get('DB_WORKER_POOL_SIZE') or 10)
+    
+    # Conexões simultâneas aceitas pelo servidor de produção (server.py)
+    SERVER_MAX_CONNECTIONS = int(os.environ.get('SERVER_MAX_CONNECTIONS') or 20000)
+    
+    # Fila de mensagens do Socket.IO para vários workers (ex.: redis://localhost:6379/0)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
+    
     # Configurações do Admin
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME') or 'admin'
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD') or 'admin'
@@ -19,4 +51,35 @@ class Config:
     MAX_USERS = 3
     QUEUE_TIMEOUT = 30
     CHOICE_TIMEOUT = 120
-    MAX_EVENTS = 30
\ No newline at end of file
+    MAX_EVENTS = 30
+    
+    # Tempo máximo (em segundos) que as configurações ficam em cache
+    SETTINGS_CACHE_TTL = 30
+    
+    # Intervalo (em segundos) para envio agrupado das atualizações de vagas
+    SLOT_BROADCAST_INTERVAL = 0.1
+    
+    # Intervalo (em segundos) para envio dos contadores e deltas da fila de espera
+    STATUS_BROADCAST_INTERVAL = 0.2
+    
+    # Intervalo (em segundos) da gravação em lote das reservas temporárias
+    HOLD_FLUSH_INTERVAL = 0.01
+    
+    # Presença: intervalo (em segundos) do heartbeat/reaper e tempo sem heartbeat até um worker ser considerado morto
+    PRESENCE_HEARTBEAT_INTERVAL = 5
+    PRESENCE_TIMEOUT = 15
+    
+    # Reconexão: janela (em segundos) em que o usuário desconectado mantém o lugar,
+    # atraso mínimo sugerido e ritmo (reconexões por segundo por worker) usado para espalhar as reconexões
+    RESUME_GRACE = 10
+    RECONNECT_DELAY = 1
+    RECONNECT_RATE = 200
+    
+    # Bomba de admissão: intervalo (em segundos) entre lotes e tamanho máximo de cada lote
+    ADMISSION_TICK = 0.25
+    ADMISSION_BATCH_SIZE = 50
+    
+    # Logging assíncrono: nível, amostragem das mensagens frequentes (1 a cada N) e tamanho da fila
+    LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
+    LOG_SAMPLE_RATE = int(os.environ.get('LOG_SAMPLE_RATE') or 100)
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE') or 10000)
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""Add reservation indexes and backfill available_slots
+
+Revision ID: 8f2b6c41d9a7
+Revises: 31c376b3eb81
+Create Date: 2026-10-18 10:12:37.418305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2b6c41d9a7'
+down_revision = '31c376b3eb81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.create_index('ix_reservation_event_id_status', ['event_id', 'status'], unique=False)
+        batch_op.create_index('ix_reservation_event_id_session_id_status', ['event_id', 'session_id', 'status'], unique=False)
+        batch_op.create_index('ix_reservation_status_expires_at', ['status', 'expires_at'], unique=False)
+
+    # available_slots passa a ser mantido a cada reserva; recalcula o valor atual
+    op.execute("""
+        UPDATE event SET available_slots = total_slots - (
+            SELECT COUNT(*) FROM reservation
+            WHERE reservation.event_id = event.id
+              AND reservation.status IN ('temporary', 'confirmed')
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('reservation', schema=None) as batch_op:
+        batch_op.drop_index('ix_reservation_status_expires_at')
+        batch_op.drop_index('ix_reservation_event_id_session_id_status')
+        batch_op.drop_index('ix_reservation_event_id_status')
@@ -0,0 +1,32 @@
+"""Add socket rate limits to Settings
+
+Revision ID: c3e91a7d5b20
+Revises: 8f2b6c41d9a7
+Create Date: 2026-10-18 13:40:05.129874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e91a7d5b20'
+down_revision = '8f2b6c41d9a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('settings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('socket_rate_limit', sa.Integer(), nullable=True, server_default='5'))
+        batch_op.add_column(sa.Column('socket_burst_limit', sa.Integer(), nullable=True, server_default='10'))
+        batch_op.add_column(sa.Column('ip_rate_limit', sa.Integer(), nullable=True, server_default='50'))
+        batch_op.add_column(sa.Column('ip_burst_limit', sa.Integer(), nullable=True, server_default='200'))
+
+
+def downgrade():
+    with op.batch_alter_table('settings', schema=None) as batch_op:
+        batch_op.drop_column('ip_burst_limit')
+        batch_op.drop_column('ip_rate_limit')
+        batch_op.drop_column('socket_burst_limit')
+        batch_op.drop_column('socket_rate_limit')
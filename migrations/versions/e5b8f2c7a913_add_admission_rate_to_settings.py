@@ -0,0 +1,26 @@
+"""Add admission rate to Settings
+
+Revision ID: e5b8f2c7a913
+Revises: c3e91a7d5b20
+Create Date: 2026-10-18 16:32:47.508211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b8f2c7a913'
+down_revision = 'c3e91a7d5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('settings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('admission_rate', sa.Integer(), nullable=True, server_default='20'))
+
+
+def downgrade():
+    with op.batch_alter_table('settings', schema=None) as batch_op:
+        batch_op.drop_column('admission_rate')
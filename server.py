@@ -0,0 +1,43 @@
+"""
+Servidor de produção do EventReserve.
+
+Executa os handlers do Socket.IO em green threads do eventlet, com o trabalho
+de banco de dados em um pool limitado de threads (DB_WORKER_POOL_SIZE), e sem
+o modo debug do run.py. Uso:
+
+    python server.py
+
+Variáveis de ambiente: HOST, PORT, SERVER_MAX_CONNECTIONS, DB_WORKER_POOL_SIZE.
+"""
+import os
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'eventlet')
+
+import eventlet
+eventlet.monkey_patch()
+
+import resource
+import signal
+import sys
+
+from app import app, socketio
+
+def raise_file_limit():
+    """Eleva o limite de descritores de arquivo para suportar milhares de sockets"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+def exit_on_sigterm():
+    """Converte o SIGTERM em saída normal, para os ganchos de encerramento (atexit) rodarem"""
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+if __name__ == '__main__':
+    raise_file_limit()
+    exit_on_sigterm()
+    socketio.run(app,
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', 5000)),
+        debug=False,
+        log_output=False,
+        max_size=app.config['SERVER_MAX_CONNECTIONS']
+    )